@@ -0,0 +1,110 @@
+# Archival of completed trips: moves reservations whose arrival is in the past out of the Reservations table into
+# ReservationsArchive, so the live table, its indexes and the default views only hold current bookings.
+# Reservations are moved in batches, one transaction per batch, so the GUI can keep writing in between.
+# Archived reservations can still be listed or exported on demand (see rc.searchArchivedReservations()).
+#
+# The archive is the reservations_archive table of the reservations database, or a separate file with
+# --archive-db / RESERVATIONS_ARCHIVE_DB. Schedule "archive --compact" with cron (or Task Scheduler) to run it nightly.
+#
+# Usage: python reservationsArchive.py archive [--before "2030-01-01 00:00:00"] [--batch-size 1000] [--compact]
+#        python reservationsArchive.py compact [--pages 1000] [--full]
+#        python reservationsArchive.py list [--passport A1234567] [--name Smith] [--destination Tokyo] [--limit 20] [--offset 0]
+# Options for every command: [--db reservations.db] [--archive-db archive.db] [--profile fast]
+
+import argparse
+import sys
+import time
+from datetime import datetime
+import reservationsController as rc
+import reservationsModel as rm
+
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+# Moves every reservation that arrived before `before` (default: now) into the archive, batchSize at a time.
+# Returns a summary dict with the number archived, the number of batches and the elapsed seconds.
+def archiveCompletedTrips(before=None, batchSize=1000, verbose=True) -> dict:
+    if before == None:
+        before = datetime.now()
+    cutoff = before.strftime(DATE_FORMAT) if isinstance(before, datetime) else str(before)
+
+    stats = {'archived': 0, 'batches': 0}
+    start = time.perf_counter()
+    while True:
+        count = rm.archiveReservationsBatch(cutoff, batchSize)
+        if count == 0:
+            break
+        stats['archived'] += count
+        stats['batches'] += 1
+        if verbose:
+            print("Archived {} reservations...".format(stats['archived']), file=sys.stderr)
+    stats['seconds'] = time.perf_counter() - start
+    return(stats)
+
+
+def _printCompaction(report: dict) -> None:
+    for schema, stats in report.items():
+        print("{}: {} -> {} pages ({} free -> {} free), auto_vacuum {}".format(schema, stats['pages_before'], stats['pages_after'], \
+            stats['free_before'], stats['free_after'], stats['auto_vacuum']))
+        if stats.get('changes_pruned', 0) > 0:
+            print("  pruned {} change log entries".format(stats['changes_pruned']))
+        if stats['auto_vacuum'] != 'incremental' and stats['free_after'] > 0:
+            print("  {} free pages were not released; run 'compact --full' once to enable incremental vacuum".format(stats['free_after']))
+
+
+def _printRows(rows: list) -> None:
+    print("\t".join(rc.retrieveTreeColumnNames()))
+    for row in rows:
+        print("\t".join(str(value) for value in row[:7]))
+
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--db', dest='dbPath', default=None, help="Database file (default: RESERVATIONS_DB or reservations.db)")
+    common.add_argument('--archive-db', dest='archivePath', default=None, help="Archive file (default: RESERVATIONS_ARCHIVE_DB or the database file)")
+    common.add_argument('--profile', choices=list(rm.DB_PROFILES), default=None, help="Sqlite engine profile")
+
+    parser = argparse.ArgumentParser(description="Archive completed trips and compact the reservations database")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    archive = commands.add_parser('archive', parents=[common], help="Move completed trips into the archive")
+    archive.add_argument('--before', default=None, help="Archive trips arriving before this date/time (default: now)")
+    archive.add_argument('--batch-size', dest='batchSize', type=int, default=1000, help="Reservations per transaction")
+    archive.add_argument('--compact', action='store_true', help="Compact the database afterwards")
+
+    compact = commands.add_parser('compact', parents=[common], help="Release free pages (incremental VACUUM) and ANALYZE")
+    compact.add_argument('--pages', type=int, default=None, help="Free pages to release per database (default: all)")
+    compact.add_argument('--full', action='store_true', help="Full VACUUM; also enables incremental vacuum on older databases")
+
+    listing = commands.add_parser('list', parents=[common], help="List archived reservations")
+    listing.add_argument('--passport', dest='passportNumber', default=None)
+    listing.add_argument('--name', dest='namePrefix', default=None, help="Names starting with")
+    listing.add_argument('--destination', default=None)
+    listing.add_argument('--date-from', dest='dateFrom', default=None, help="Departures on or after this date")
+    listing.add_argument('--date-to', dest='dateTo', default=None, help="Arrivals on or before this date")
+    listing.add_argument('--limit', type=int, default=20)
+    listing.add_argument('--offset', type=int, default=0)
+    args = parser.parse_args()
+
+    rm.configureDatabase(args.dbPath, args.profile)
+    if args.archivePath != None:
+        rm.configureArchive(args.archivePath)
+    rm.create_Reservations_archive()
+
+    if args.command == 'archive':
+        stats = archiveCompletedTrips(args.before, args.batchSize)
+        print("Archived: {}  Batches: {}  Elapsed: {:.2f}s".format(stats['archived'], stats['batches'], stats['seconds']))
+        if args.compact:
+            _printCompaction(rm.compactDatabase())
+    elif args.command == 'compact':
+        _printCompaction(rm.compactDatabase(args.pages, args.full))
+    elif args.command == 'list':
+        filters = {'passportNumber': args.passportNumber, 'namePrefix': args.namePrefix, 'destination': args.destination, \
+            'dateFrom': args.dateFrom, 'dateTo': args.dateTo}
+        _printRows(rc.retrieveArchivedReservations(filters, args.limit, args.offset))
+        print("{} archived reservations match".format(rc.countArchivedReservations(filters)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+# Headless benchmark suite for the reservationsModel and reservationsController hot paths.
+# Seeds a temporary database with synthetic reservations, times each operation and reports
+# p50/p95 latency and throughput as JSON so results can be compared across commits.
+# Each size runs in a fresh process, so the peak RSS reported per run (after seeding and overall) is that size's own.
+#
+# Usage: python reservationsBenchmark.py [--sizes 10000 100000 1000000] [--repeat 20] [--read-snapshot] [--date-storage epoch]
+#                                        [--query-cache-size 256] [--view] [--output bench.json]
+# The controller's query cache is off unless --query-cache-size is given, so the timings measure the database.
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+import reservationsModel as rm
+import reservationsController as rc
+
+
+FIRST_NAMES = ['Anna', 'Boris', 'Chen', 'Dana', 'Emil', 'Fatima', 'Goran', 'Hana', 'Ivan', 'Julia', 'Kenji', 'Leila']
+LAST_NAMES = ['Ivanova', 'Smith', 'Wang', 'Haddad', 'Novak', 'Tanaka', 'Dubois', 'Rossi', 'Khan', 'Silva']
+SEED_CHUNK = 10000
+
+
+# Synthetic data -----------------------------------------------------------------------------------------------------------------
+# Yields reservation dicts with future departure/arrival dates; the same seed always gives the same rows
+def generateReservations(count: int, destinations: list, seed=42):
+    rnd = random.Random(seed)
+    start = datetime.now().replace(microsecond=0) + timedelta(days=1)
+    for n in range(count):
+        departure = start + timedelta(minutes=rnd.randrange(0, 60 * 24 * 365))
+        arrival = departure + timedelta(minutes=rnd.randrange(60, 60 * 20))
+        yield {
+            'name': "{} {}".format(rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES)),
+            'gender': rnd.choice(('Male', 'Female')),
+            'passport_number': "{}{:07d}".format(chr(65 + rnd.randrange(26)), n),
+            'destination': rnd.choice(destinations),
+            'departure_dt': departure.strftime("%Y-%m-%d %H:%M:%S"),
+            'arrival_dt': arrival.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+
+def seedDatabase(path: str, count: int, profile=None, dateStorage=None) -> float:
+    rm.configureDatabase(path, profile, dateStorage)
+    rm.create_tables()
+    with contextlib.redirect_stdout(sys.stderr): # Keep stdout for the JSON report
+        rm.addDestinationsRecords()
+    destinations = [row['city'] for row in rm.getDestinationsData()]
+
+    start = time.perf_counter()
+    chunk = []
+    for row in generateReservations(count, destinations):
+        chunk.append(row)
+        if len(chunk) >= SEED_CHUNK:
+            rm.createReservationsBatch(chunk)
+            chunk = []
+    if len(chunk) > 0:
+        rm.createReservationsBatch(chunk)
+    return(time.perf_counter() - start)
+# End of synthetic data ----------------------------------------------------------------------------------------------------------
+
+
+def _peakRssMB() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    return(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024)
+
+
+def _percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return(ordered[index])
+
+
+# Latency stats for samples in milliseconds
+def _sampleStats(samples: list, rowsPerCall=1) -> dict:
+    total = sum(samples) / 1000
+    result = {
+        'calls': len(samples),
+        'p50_ms': round(_percentile(samples, 50), 4),
+        'p95_ms': round(_percentile(samples, 95), 4),
+        'mean_ms': round(statistics.mean(samples), 4),
+        'calls_per_s': round(len(samples) / total, 2) if total > 0 else None,
+        'rows_per_s': round(len(samples) * rowsPerCall / total, 2) if total > 0 else None,
+    }
+    return(result)
+
+
+# Calls func(n) repeat times, n = 0..repeat-1; returns latency stats in milliseconds
+def timeCall(func, repeat: int, rowsPerCall=1) -> dict:
+    samples = []
+    for n in range(repeat):
+        start = time.perf_counter()
+        func(n)
+        samples.append((time.perf_counter() - start) * 1000)
+    return(_sampleStats(samples, rowsPerCall))
+
+
+def runBenchmarks(size: int, repeat: int, fullRepeat: int) -> dict:
+    maxId = rm.getReservationIdAtOffset(0)
+    destinations = [str(e[0]) for e in rc.retrieveDestinations()]
+    created = []
+
+    def create(n):
+        rc.createReservation('Bench Passenger', 'Female', 'B{:07d}'.format(n), destinations[n % len(destinations)], \
+            '2099-01-01 10:00:00', '2099-01-01 18:00:00')
+
+    def update(n):
+        rc.updateReservation(maxId - n, 'Bench Update', 'Male', 'U{:07d}'.format(n), destinations[n % len(destinations)], \
+            '2099-02-01 10:00:00', '2099-02-01 18:00:00')
+
+    def delete(n):
+        rc.deleteReservation(created[n])
+
+    results = {}
+    results['getReservationsData'] = timeCall(lambda n: list(rm.getReservationsData()), fullRepeat, size)
+    results['_retrieveReservationsList'] = timeCall(lambda n: rc._retrieveReservationsList(), fullRepeat, size)
+    results['_retrieveReservationsTreeData'] = timeCall(lambda n: rc._retrieveReservationsTreeData(), fullRepeat, size)
+    results['ReservationsPager.firstPage'] = timeCall(lambda n: rc.ReservationsPager(20).firstPage(), repeat, 20)
+    # One week of departures, a month ahead (the seeded trips depart over the next year)
+    dateFrom = datetime.now().replace(microsecond=0) + timedelta(days=30)
+    dateRange = {'dateFrom': dateFrom.strftime(rm.DATE_FORMAT), 'dateTo': (dateFrom + timedelta(days=7)).strftime(rm.DATE_FORMAT)}
+    results['getReservationsCount(dateRange)'] = timeCall(lambda n: rm.getReservationsCount(dateRange), repeat)
+    results['ReservationsPager.firstPage(dateRange)'] = timeCall(lambda n: rc.ReservationsPager(20, dateRange).firstPage(), repeat, 20)
+    results['getReservationsCount(destination)'] = timeCall(lambda n: \
+        rm.getReservationsCount({'destination': destinations[n % len(destinations)]}), repeat)
+    results['searchReservations(destination)'] = timeCall(lambda n: \
+        rc.searchReservations({'destination': destinations[n % len(destinations)]}, 20), repeat, 20)
+    results['createReservation'] = timeCall(create, repeat)
+    created = [row[0] for row in rm.getReservationsPage(repeat)]
+    results['updateReservation'] = timeCall(update, repeat)
+    results['deleteReservation'] = timeCall(delete, repeat)
+    results['getDestinationsData'] = timeCall(lambda n: list(rm.getDestinationsData()), repeat)
+    results['retrieveDestinationIndex'] = timeCall(lambda n: rc.retrieveDestinationIndex(destinations[n % len(destinations)]), repeat)
+    return(results)
+
+
+# Replays paging, sorting and typeahead search through the Reservations window's run() loop on the headless view
+# backend. Each event is timed as handled by the loop: 'Next >>' covers the page query and the TreeData build (the DB
+# calls run inline), '-DB_RESULT- page' the View's refreshTree() and TreeData update. No display or tkinter time is included.
+def runViewBenchmarks(repeat: int) -> dict:
+    import reservationsView
+    import reservationsViewBackend as vb
+    backend = vb.HeadlessBackend(record=False)
+    headings = list(rc.retrieveSortColumns())
+    events = ['Next >>'] * repeat + ['<< Previous'] * repeat
+    events += [('-SORT-', {'-SORT-': headings[n % len(headings)]}) for n in range(repeat)]
+    events += [('-F_Text-', {'-F_Text-': text}) for text in ('S', 'Sm', 'Smi', 'Smit', 'Smith')] * max(1, repeat // 5)
+    events.append('Exit')
+    backend.script('Reservations', events)
+    previous = vb.getBackend()
+    vb.setBackend(backend)
+    try:
+        reservationsView.ReservationsWindow('Reservations').run()
+    finally:
+        vb.setBackend(previous)
+    return({'view ' + label: _sampleStats(samples) for label, samples in backend.eventTimings().items()})
+
+
+# Seeds a database of size reservations and runs the benchmarks on it; run in its own process by main()
+def runSize(size: int, args) -> dict:
+    rc.configureQueryCache(args.queryCacheSize)
+    with tempfile.TemporaryDirectory() as tmpDir:
+        path = os.path.join(tmpDir, 'reservations_bench.db')
+        print("Seeding {} reservations...".format(size), file=sys.stderr)
+        seedSeconds = seedDatabase(path, size, args.profile, args.dateStorage)
+        seedRssMB = _peakRssMB()
+        rc.invalidateDestinations()
+        rc.clearQueryCache(resetStats=True)
+        if args.readSnapshot:
+            rm.enableReadSnapshot()
+        results = runBenchmarks(size, args.repeat, args.fullRepeat)
+        if args.view:
+            results.update(runViewBenchmarks(args.repeat))
+        fileBytes = sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+        run = {'size': size, 'seed_s': round(seedSeconds, 3), 'db_size_mb': round(fileBytes / (1024 * 1024), 1), \
+            'seed_peak_rss_mb': round(seedRssMB, 1), 'peak_rss_mb': round(_peakRssMB(), 1), 'results': results}
+        if args.readSnapshot:
+            run['read_snapshot'] = rm.getReadSnapshotStats()
+            rm.disableReadSnapshot()
+        if args.queryCacheSize > 0:
+            run['query_cache'] = rc.getQueryCacheStats()
+        rm.db.close()
+    return(run)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark reservationsModel/reservationsController hot paths")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help="Reservations to seed per run")
+    parser.add_argument('--repeat', type=int, default=20, help="Calls per single-row or page operation")
+    parser.add_argument('--full-repeat', dest='fullRepeat', type=int, default=3, help="Calls per full-table operation")
+    parser.add_argument('--profile', choices=list(rm.DB_PROFILES), default=None, help="Sqlite engine profile")
+    parser.add_argument('--read-snapshot', dest='readSnapshot', action='store_true', help="Serve reads from the in-memory snapshot")
+    parser.add_argument('--date-storage', dest='dateStorage', choices=rm.DATE_STORAGES, default=None, \
+        help="Store dates as text or epoch seconds (default: RESERVATIONS_DATE_STORAGE or text)")
+    parser.add_argument('--query-cache-size', dest='queryCacheSize', type=int, default=0, \
+        help="Entries in the controller's query result cache (default: 0, disabled)")
+    parser.add_argument('--view', action='store_true', help="Also time the Reservations window on the headless view backend")
+    parser.add_argument('--output', default=None, help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'profile': args.profile or rm.DB_PROFILE,
+        'read_snapshot': args.readSnapshot,
+        'date_storage': args.dateStorage or rm.getDateStorage(),
+        'query_cache_size': args.queryCacheSize,
+        'runs': [],
+    }
+
+    context = multiprocessing.get_context('spawn') # Fresh interpreter per size, so ru_maxrss starts over
+    for size in args.sizes:
+        with context.Pool(1) as pool:
+            report['runs'].append(pool.apply(runSize, (size, args)))
+
+    text = json.dumps(report, indent=2)
+    if args.output == None:
+        print(text)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,77 +3,909 @@
 # Converts reservationsModel data to a format usable by reservationsView.
 # Updates reservationsView when the reservationsModel has changed.
 
+import contextvars
+import functools
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
 from PySimpleGUI import TreeData
 import reservationsModel as rm
 
 
-# Converts dict returned by getReservationsData() to
-# list of lists: each list is a row in the Reservations table	
+# Tree deltas sent to reservationsView.refreshTree(): (DELTA_DELETE, key) or (DELTA_UPDATE, key, values)
+DELTA_DELETE = 'delete'
+DELTA_UPDATE = 'update'
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+# List of row tuples: each tuple is a row in the Reservations table.
+# Dates stay as stored (text or epoch seconds), use formatDateTime() for display
 def _retrieveReservationsList() -> list:
-	tableData = rm.getReservationsData()
-	valuesList = [*[list(idx.values()) for idx in tableData ]]
+	valuesList = list(rm.getReservationsRows())
 	return(valuesList)
 
 
-# Converts dict returned by getDestinationsData() to
-# list of lists: each list is a row in the Destinations table
-def _retrieveDestinationsList() -> list:
-	tableData = rm.getDestinationsData()
-	valuesList = [*[list(idx.values()) for idx in tableData ]]
+# Converts dicts returned by getDestinationsData() to
+# list of lists: each list holds the city of a row in the Destinations table
+def _retrieveDestinationsList(tableData) -> list:
+	valuesList = [[row['city']] for row in tableData]
 	return(valuesList)
 
+
+# Destinations cache: list in display order, a city -> list index map and a destination_id -> city map.
+# Reloaded only when rm.destinationsVersion changes (or after invalidateDestinations()). Read by the GUI thread and the
+# DB worker: a reload builds a new dict and replaces the old one, so a caller never sees a half-built cache.
+_destinationsCache = {'version': None, 'list': [], 'index': {}, 'cities': {}}
+_destinationsLock = threading.Lock()
+
+def _getDestinationsCache() -> dict:
+    global _destinationsCache
+    with _destinationsLock:
+        if _destinationsCache['version'] != rm.destinationsVersion:
+            version = rm.destinationsVersion # Read before the table: a change made meanwhile reloads again
+            tableData = list(rm.getDestinationsData())
+            destinations = _retrieveDestinationsList(tableData)
+            _destinationsCache = {
+                'version': version,
+                'list': destinations,
+                'index': {str(e[0]): n for n, e in enumerate(destinations)},
+                'cities': {row['destination_id']: row['city'] for row in tableData},
+            }
+        return(_destinationsCache)
+
+
+# Forces a reload, e.g. after the Destinations table was changed by another process
+def invalidateDestinations() -> None:
+    global _destinationsCache
+    with _destinationsLock:
+        _destinationsCache = dict(_destinationsCache, version=None)
+    return()
+
+
+# Query result cache ----------------------------------------------------------------------------------------------------------------
+# Results of the read functions below, keyed by function and arguments, at most maxEntries of them (least recently used
+# evicted first). Each entry holds the data stamp it was read under (rm.getDataStamp(): this process's write counters and
+# PRAGMA data_version, which changes when another process commits) and is only returned while the stamp is unchanged.
+# Cached results are shared between callers, do not modify them.
+# RESERVATIONS_QUERY_CACHE_SIZE sets the number of entries, 0 disables the cache.
+QUERY_CACHE_SIZE = int(os.environ.get('RESERVATIONS_QUERY_CACHE_SIZE', 256))
+
+
+class QueryCache:
+    def __init__(self, maxEntries=QUERY_CACHE_SIZE) -> None:
+        self.maxEntries = maxEntries
+        self._entries = OrderedDict() # key -> (stamp, result), least recently used first
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0}
+        
+        
+    # Returns (found, result); an entry read under another stamp is dropped and counted as stale
+    def get(self, key, stamp) -> tuple:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry != None and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return((True, entry[1]))
+            if entry != None:
+                del self._entries[key]
+                self._stats['stale'] += 1
+            self._stats['misses'] += 1
+        return((False, None))
+    
+    
+    def put(self, key, stamp, result) -> None:
+        with self._lock:
+            if self.maxEntries <= 0:
+                return()
+            self._entries[key] = (stamp, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return()
+    
+    
+    def resize(self, maxEntries: int) -> None:
+        with self._lock:
+            self.maxEntries = maxEntries
+            while len(self._entries) > max(0, maxEntries):
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return()
+    
+    
+    def clear(self, resetStats=False) -> None:
+        with self._lock:
+            self._entries.clear()
+            if resetStats:
+                self._stats = dict.fromkeys(self._stats, 0)
+        return()
+    
+    
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries), max_entries=self.maxEntries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups > 0 else 0.0
+        return(stats)
+
+
+_queryCache = QueryCache()
+
+
+# Hashable form of call arguments: filter dicts and key lists become tuples
+def _freeze(value):
+    if isinstance(value, dict):
+        return(('dict',) + tuple(sorted((k, _freeze(v)) for k, v in value.items())))
+    if isinstance(value, (list, tuple)):
+        return(tuple(_freeze(v) for v in value))
+    return(value)
+
+
+def _dataStamp():
+    return(rm.getDataStamp())
+
+
+# Decorator: caches func's results in the query cache. stamp: function returning the version the result depends on,
+# None for results that never change while the app runs (e.g. column names). The stamp is taken before the call, so a
+# write that lands during the call makes the entry stale rather than hiding the write.
+def cachedQuery(stamp=_dataStamp):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _queryCache.maxEntries <= 0:
+                return(func(*args, **kwargs))
+            key = (func.__qualname__, _freeze(args), _freeze(kwargs))
+            current = None if stamp == None else stamp()
+            found, result = _queryCache.get(key, current)
+            if not found:
+                result = func(*args, **kwargs)
+                _queryCache.put(key, current, result)
+            return(result)
+        return(wrapper)
+    return(decorator)
+
+
+# Cached model reads used by the pager and the search functions below
+_getReservationsSortedPage = cachedQuery()(rm.getReservationsSortedPage)
+_getReservationsCount = cachedQuery()(rm.getReservationsCount)
+_getReservationKeyAtOffset = cachedQuery()(rm.getReservationKeyAtOffset)
+_findReservations = cachedQuery()(rm.findReservations)
+_searchReservationsText = cachedQuery()(rm.searchReservationsText)
+_findArchivedReservations = cachedQuery()(rm.findArchivedReservations)
+_getArchivedReservationsCount = cachedQuery()(rm.getArchivedReservationsCount)
+
+
+# {'hits', 'misses', 'stale', 'evictions', 'entries', 'max_entries', 'hit_rate'}
+def getQueryCacheStats() -> dict:
+    return(_queryCache.stats())
+
+
+def clearQueryCache(resetStats=False) -> None:
+    _queryCache.clear(resetStats)
+    return()
+
+
+# Sets the number of entries kept, 0 disables the cache
+def configureQueryCache(maxEntries: int) -> None:
+    _queryCache.resize(maxEntries)
+    return()
+# End of query result cache ---------------------------------------------------------------------------------------------------------
+
     
+@cachedQuery(stamp=None)
 def retrieveTreeColumnNames() -> list:
     columnNames = rm.retrieveColumnNames()
     return(columnNames)
 
 
-# PySimpleGUI.TreeData
+# Tree column headings that can be sorted on: verbose name -> sort column for ReservationsPager.setSort()
+@cachedQuery(stamp=None)
+def retrieveSortColumns() -> dict:
+    return(rm.retrieveSortColumns())
+
+
+# PySimpleGUI.TreeData, rows are streamed from the cursor straight into the tree
 def _retrieveReservationsTreeData() -> TreeData:
+    treedata = _buildReservationsTreeData(rm.getReservationsRows())
+    return(treedata)
+
+
+# Row dates are read as stored (text or epoch seconds, see rm.getDateStorage()) and only converted for display when needed
+def formatDateTime(value) -> str:
+    if isinstance(value, datetime):
+        return(value.strftime(DATE_FORMAT))
+    if isinstance(value, int):
+        return(rm.epochToText(value))
+    return(str(value)[:19]) # Drop any stored microseconds
+
+
+# Row tuple as displayed: the destination_id joined to its city through the destinations cache, and the dates as
+# text when they are stored as epoch seconds
+def formatReservationRow(row: tuple) -> tuple:
+    destination = retrieveDestinationCity(row[4]) if isinstance(row[4], int) else row[4]
+    if isinstance(row[5], int):
+        return(row[:4] + (destination, rm.epochToText(row[5]), rm.epochToText(row[6])) + row[7:])
+    return(row[:4] + (destination,) + row[5:])
+
+
+# Stable TreeData key for a reservation, so single rows can be patched in the View
+def reservationKey(idval) -> str:
+    return("-res_{}-".format(idval))
+
+
+# Convert rows (any iterable of row tuples) to PySimpleGUI TreeData format, rows are numbered from startNum.
+# Dates are formatted here, so only the rows put in the tree are converted.
+def _buildReservationsTreeData(reservationsList, startNum=1) -> TreeData:
     treedata = TreeData()
     
-    reservationsList = _retrieveReservationsList()
-
-    # Convert to PySimpleGUI TreeData format
-    n = 0
+    n = startNum - 1
     for res in reservationsList:
         n += 1
-        keystr = "-row_{}-".format(n)
-        treedata.Insert('', key=keystr, text= n, values=res)
+        treedata.Insert('', key=reservationKey(res[0]), text= n, values=formatReservationRow(res))
+        
+    return(treedata)
+
+
+# Keyset-paginated data source for the Reservations Window tree.
+# Remembers the sort keys of the first and last rows of the current page so that moving to the next or
+# previous page is an index seek in the sort order (see rm.SORT_COLUMNS); only one page of rows is held in memory.
+# sort: (sort column, descending), default newest first.
+class ReservationsPager:
+    def __init__(self, pageSize=20, filters=None, sort=None) -> None:
+        self.pageSize = pageSize
+        self.pageNum = 1
+        self.filters = _normalizeFilters(filters)
+        self.sort = rm.DEFAULT_SORT if sort == None else sort
+        self.treedata = TreeData()
+        self._startKey = None # Keyset bound used to load the current page, inclusive (None for first page)
+        self._firstKey = None
+        self._lastKey = None
+        self._rowCount = None
+        
+
+    def _load(self, rows: list) -> TreeData:
+        if len(rows) > 0:
+            self._firstKey = rm.reservationSortKey(rows[0], self.sort)
+            self._lastKey = rm.reservationSortKey(rows[-1], self.sort)
+        else:
+            self._firstKey = None
+            self._lastKey = None
+        self._startKey = None if self.pageNum == 1 else self._firstKey
         
+        startNum = (self.pageNum - 1) * self.pageSize + 1
+        self.treedata = _buildReservationsTreeData(rows, startNum)
+        return(self.treedata)
+    
+    
+    def _page(self, key=None, previous=False, inclusive=False) -> list:
+        return(_getReservationsSortedPage(self.pageSize, self.sort, key, previous, inclusive, self.filters))
+    
+    
+    def pageCount(self) -> int:
+        if self._rowCount == None:
+            self._rowCount = _getReservationsCount(self.filters)
+        return(max(1, -(-self._rowCount // self.pageSize)))
+    
+    
+    def firstPage(self) -> TreeData:
+        self.pageNum = 1
+        rows = self._page()
+        return(self._load(rows))
+    
+    
+    def nextPage(self) -> TreeData:
+        if self._lastKey == None:
+            return(self.treedata)
+        rows = self._page(self._lastKey)
+        if len(rows) == 0: # Already on the last page
+            return(self.treedata)
+        self.pageNum += 1
+        return(self._load(rows))
+    
+    
+    def previousPage(self) -> TreeData:
+        if self.pageNum <= 1 or self._firstKey == None:
+            return(self.firstPage())
+        rows = self._page(self._firstKey, previous=True)
+        self.pageNum -= 1
+        if self.pageNum == 1 or len(rows) < self.pageSize:
+            return(self.firstPage())
+        return(self._load(rows))
+    
+    
+    def jumpToPage(self, pageNum: int) -> TreeData:
+        pageNum = min(max(1, pageNum), self.pageCount())
+        if pageNum == 1:
+            return(self.firstPage())
+        # Last row of the preceding page is the keyset bound for the requested page
+        boundKey = _getReservationKeyAtOffset((pageNum - 1) * self.pageSize - 1, self.filters, self.sort)
+        if boundKey == None:
+            return(self.firstPage())
+        self.pageNum = pageNum
+        rows = self._page(boundKey)
+        return(self._load(rows))
+    
+    
+    # Replace the filters (see searchReservations()) and go back to the first page
+    def setFilters(self, filters: dict) -> TreeData:
+        self.filters = _normalizeFilters(filters)
+        self._rowCount = None
+        return(self.firstPage())
+    
+    
+    # Change the sort order (a rm.SORT_COLUMNS column) and go back to the first page; the filters are kept
+    def setSort(self, column: str, descending=False) -> TreeData:
+        if column not in rm.SORT_COLUMNS:
+            raise ValueError("Cannot sort reservations by {}".format(column))
+        self.sort = (column, descending)
+        return(self.firstPage())
+    
+    
+    def rowDeleted(self) -> None:
+        if self._rowCount != None:
+            self._rowCount -= 1
+        return()
+    
+    
+    # Re-read the current page, e.g. after the last row of the page was deleted
+    def reload(self) -> TreeData:
+        self._rowCount = None
+        if self._startKey == None:
+            return(self.firstPage())
+        rows = self._page(self._startKey, inclusive=True)
+        if len(rows) == 0: # Last row of the last page was deleted
+            return(self.jumpToPage(self.pageNum - 1))
+        return(self._load(rows))
+
+
+# Drops empty filter values; a date-only dateTo ("%Y-%m-%d") includes the whole day
+def _normalizeFilters(filters) -> dict:
+    if filters == None:
+        return(None)
+    normalized = {}
+    for name, value in filters.items():
+        if value == None:
+            continue
+        value = str(value).strip()
+        if len(value) > 0:
+            normalized[name] = value
+    if len(normalized.get('dateTo', '')) == 10:
+        normalized['dateTo'] += " 23:59:59"
+    return(normalized if len(normalized) > 0 else None)
+
+
+# Filtered search: filters may contain passportNumber, namePrefix, destination, dateFrom and dateTo.
+# sort: optional (sort column, descending), see rm.SORT_COLUMNS.
+# Only limit rows are read from Sqlite, starting at offset.
+def searchReservations(filters: dict, limit=20, offset=0, sort=None) -> TreeData:
+    rows = _findReservations(_normalizeFilters(filters), limit, offset, sort)
+    treedata = _buildReservationsTreeData(rows, offset + 1)
+    return(treedata)
+
+
+# Typeahead passenger search: fragments of names and passport numbers (see rm.searchReservationsText()),
+# best matches first. Returns the top limit rows as TreeData; filters are applied as in searchReservations().
+SEARCH_LIMIT = 100
+
+def searchPassengers(text: str, filters=None, limit=SEARCH_LIMIT) -> TreeData:
+    rows = _searchReservationsText(text, limit, _normalizeFilters(filters))
+    treedata = _buildReservationsTreeData(rows)
+    return(treedata)
+
+
+# Generator over all reservations matching filters (see searchReservations()), newest first or in sort order.
+# Rows are row tuples read from a non-caching cursor, so memory does not grow with the table size.
+# Dates are yielded as display text (see formatReservationRow()).
+def streamReservations(filters=None, sort=None):
+    for row in rm.getReservationsRows(_normalizeFilters(filters), sort):
+        yield formatReservationRow(row)
+
+
+# Archived reservations (completed trips moved out by reservationsArchive), read on demand only.
+# filters as in searchReservations(); most recently archived first.
+def retrieveArchivedReservations(filters=None, limit=20, offset=0) -> list:
+    return([formatReservationRow(row) for row in _findArchivedReservations(_normalizeFilters(filters), limit, offset)])
+
+
+def searchArchivedReservations(filters=None, limit=20, offset=0) -> TreeData:
+    treedata = _buildReservationsTreeData(_findArchivedReservations(_normalizeFilters(filters), limit, offset), offset + 1)
     return(treedata)
 
 
+def countArchivedReservations(filters=None) -> int:
+    return(_getArchivedReservationsCount(_normalizeFilters(filters)))
+
+
+def streamArchivedReservations(filters=None):
+    for row in rm.getArchivedReservationsRows(_normalizeFilters(filters)):
+        yield formatReservationRow(row)
+
+
+# Optional in-memory read snapshot for read-heavy screens (see rm.enableReadSnapshot()): page, count, search and
+# destinations reads are served from a copy of the database that is refreshed when the file changes.
+def enableReadSnapshot() -> None:
+    _callDB(rm.enableReadSnapshot)
+    return()
+
+
+def disableReadSnapshot() -> None:
+    _callDB(rm.disableReadSnapshot)
+    return()
+
+
+def getReadSnapshotStats() -> dict:
+    return(rm.getReadSnapshotStats())
+
+
+# Cached: the returned TreeData is shared, do not modify it
+@cachedQuery()
 def retrieveReservations() -> TreeData:
     treedata = _retrieveReservationsTreeData()
     return(treedata)
             
             
+# Cached: the returned list is shared, do not modify it. Versioned by the destinations cache alone, so a hit does
+# no database I/O on the GUI thread.
+@cachedQuery(stamp=lambda: (rm.destinationsVersion, _destinationsCache['version']))
 def retrieveDestinations() -> list:
-    destinations = _retrieveDestinationsList()
+    destinations = _getDestinationsCache()['list']
     return(destinations)
 
 
-def deleteReservation(idval, viewRef=None) -> None:
-    rm.deleteReservation(idval)
-    # Update Reservations Window Tree
+# City of a destination_id; reloads the cache once for a destination added by another process
+def retrieveDestinationCity(destinationId: int) -> str:
+    city = _getDestinationsCache()['cities'].get(destinationId)
+    if city == None:
+        invalidateDestinations()
+        city = _getDestinationsCache()['cities'].get(destinationId, str(destinationId))
+    return(city)
+
+
+# Position of city in retrieveDestinations(), None if unknown
+def retrieveDestinationIndex(city: str) -> int:
+    index = _getDestinationsCache()['index'].get(city)
+    return(index)
+
+
+# Background DB worker ---------------------------------------------------------------------------------------------------------------
+# A single thread that runs all database calls in order, so the PySimpleGUI event loops never block on I/O and
+# writes from the GUI and from batch jobs in this process go through one writer.
+# Results are delivered to the submitting window as a DB_RESULT_EVENT event whose value is (tag, result, error).
+DB_RESULT_EVENT = '-DB_RESULT-'
+
+
+class DBWorker:
+    def __init__(self, maxPending=64) -> None:
+        self._queue = queue.Queue(maxsize=maxPending) # Bounded: submit() blocks when the worker falls behind
+        self._thread = threading.Thread(target=self._run, name='reservations-db-worker', daemon=True)
+        self._thread.start()
+        
+        
+    # Leaves the change log entry changeId out of the events. Called inside the transaction that wrote it, so the
+    # entry is never read before it is marked.
+    def skipChange(self, changeId: int) -> None:
+        with self._lock:
+            self._skipped.add(changeId)
+        return()
+    
+    
+    def usesChangeLog(self) -> bool:
+        return(self._useLog)
+    
+    
+    def _run(self) -> None:
+        while True:
+            task = self._queue.get()
+            if task == None: # stop() sentinel
+                break
+            future, context, func, args, kwargs = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(context.run(func, *args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+        rm.db.close()
+        
+        
+    def isWorkerThread(self) -> bool:
+        return(threading.current_thread() is self._thread)
+    
+    
+    def submit(self, func, *args, **kwargs) -> Future:
+        future = Future()
+        # Tasks run in the submitter's context (e.g. for reservationsInstrumentation)
+        self._queue.put((future, contextvars.copy_context(), func, args, kwargs))
+        return(future)
+    
+    
+    def stop(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        return()
+
+
+_dbWorker = None
+
+def startDBWorker(maxPending=64) -> None:
+    global _dbWorker
+    if _dbWorker == None:
+        _dbWorker = DBWorker(maxPending)
+    return()
+
+
+def stopDBWorker() -> None:
+    global _dbWorker
+    if _dbWorker != None:
+        _dbWorker.stop()
+        _dbWorker = None
+    return()
+
+
+def isDBWorkerRunning() -> bool:
+    return(_dbWorker != None)
+
+
+# Runs func on the DB worker and waits for the result; runs it inline when the worker is not running
+def _callDB(func, *args, **kwargs):
+    if _dbWorker == None or _dbWorker.isWorkerThread():
+        return(func(*args, **kwargs))
+    return(_dbWorker.submit(func, *args, **kwargs).result())
+
+
+def _postResult(window, tag, future: Future) -> None:
+    error = future.exception()
+    result = None if error != None else future.result()
+    window.write_event_value(DB_RESULT_EVENT, (tag, result, error))
+    return()
+
+
+# Runs func(*args) without blocking the caller and posts (tag, result, error) to window as a DB_RESULT_EVENT.
+# Without a running worker the call runs inline, but the result is still delivered as an event so the
+# View handles both modes the same way.
+def submitDBTask(window, tag, func, *args, **kwargs) -> None:
+    if _dbWorker == None:
+        future = Future()
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        _postResult(window, tag, future)
+    else:
+        future = _dbWorker.submit(func, *args, **kwargs)
+        future.add_done_callback(lambda f: _postResult(window, tag, f))
+    return()
+# End of background DB worker ----------------------------------------------------------------------------------------------------------
+
+
+# Cross-process change notification ----------------------------------------------------------------------------------------------------
+# A timer thread polls PRAGMA data_version on its own connection. When any other connection (the DB worker, the
+# reservation form, another clerk's process) has committed, it reads the change log (rm.ReservationsChanges) from where
+# it left off and coalesces the entries per reservation. The changes are posted to every subscribed window as one
+# CHANGES_EVENT when a poll finds nothing new (the writes have settled) or maxDelay seconds after the first change.
+# Event value: {'reload': bool, 'inserted': set, 'updated': set, 'deleted': set} of reservation_ids; reload is True
+# when the individual changes are not known (no change log, more than MAX_CHANGES_PER_EVENT, or entries pruned unread).
+# Single-row edits and deletes made through this module are left out: their tree delta already patched the window
+# (see _skipOwnChange()).
+CHANGES_EVENT = '-DB_CHANGES-'
+MAX_CHANGES_PER_EVENT = 1000
+PRUNE_INTERVAL = 60.0 # Seconds between change log prunes
+
+
+def _emptyChanges() -> dict:
+    return({'reload': False, 'inserted': set(), 'updated': set(), 'deleted': set()})
+
+
+# Folds one change log entry into changes, keeping only the net effect per reservation
+def _mergeChange(changes: dict, reservationId: int, action: str) -> None:
+    if reservationId in changes['inserted']:
+        if action == 'delete': # Created and deleted again between two events
+            changes['inserted'].discard(reservationId)
+    elif action == 'insert':
+        if reservationId in changes['deleted']: # Deleted id reused by a new reservation
+            changes['deleted'].discard(reservationId)
+            changes['updated'].add(reservationId)
+        else:
+            changes['inserted'].add(reservationId)
+    elif action == 'update':
+        changes['updated'].add(reservationId)
+    else:
+        changes['updated'].discard(reservationId)
+        changes['deleted'].add(reservationId)
+    return()
+
+
+class ChangeNotifier:
+    # interval: seconds between polls; maxDelay: longest a change waits while writes keep coming;
+    # retention: age in seconds after which change log entries are pruned
+    def __init__(self, interval=0.5, maxDelay=2.0, retention=rm.CHANGES_RETENTION) -> None:
+        self._interval = interval
+        self._maxDelay = maxDelay
+        self._retention = retention
+        self._windows = []
+        self._lock = threading.Lock()
+        self._stopEvent = threading.Event()
+        self._pending = None # Changes not posted yet
+        self._firstPending = None
+        self._dataVersion = None
+        self._lastChangeId = 0
+        self._useLog = False
+        self._skipped = set() # change_ids not to report, see skipChange()
+        self._lastPrune = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name='reservations-change-notifier', daemon=True)
+        self._thread.start()
+        
+        
+    def subscribe(self, window) -> None:
+        with self._lock:
+            if window not in self._windows:
+                self._windows.append(window)
+        return()
+    
+    
+    def unsubscribe(self, window) -> None:
+        with self._lock:
+            if window in self._windows:
+                self._windows.remove(window)
+        return()
+    
+    
+    # Leaves the change log entry changeId out of the events. Called inside the transaction that wrote it, so the
+    # entry is never read before it is marked.
+    def skipChange(self, changeId: int) -> None:
+        with self._lock:
+            self._skipped.add(changeId)
+        return()
+    
+    
+    def usesChangeLog(self) -> bool:
+        return(self._useLog)
+    
+    
+    def _run(self) -> None:
+        synced = False
+        try:
+            while True:
+                try:
+                    if not synced:
+                        self._sync()
+                        synced = True
+                    else:
+                        self._poll()
+                except rm.OperationalError: # e.g. database is locked: try again on the next poll
+                    pass
+                if self._stopEvent.wait(self._interval):
+                    break
+        finally:
+            rm.db.close() # This thread's connection
+    
+    
+    def _sync(self) -> None:
+        self._useLog = rm.hasReservationsChanges()
+        self._lastChangeId = rm.getLastChangeId() if self._useLog else 0
+        self._dataVersion = rm.getDataVersion()
+        return()
+    
+    
+    def _poll(self) -> None:
+        dataVersion = rm.getDataVersion()
+        changed = dataVersion != self._dataVersion
+        if changed:
+            self._dataVersion = dataVersion
+            self._collect()
+        
+        if self._pending != None and (not changed or time.monotonic() - self._firstPending >= self._maxDelay):
+            changes = self._pending
+            self._pending = None
+            if changes['reload'] or len(changes['inserted']) + len(changes['updated']) + len(changes['deleted']) > 0:
+                self._publish(changes)
+        
+        if self._useLog and time.monotonic() - self._lastPrune >= PRUNE_INTERVAL:
+            self._lastPrune = time.monotonic()
+            rm.pruneReservationsChanges(self._retention)
+        return()
+    
+    
+    def _collect(self) -> None:
+        if self._pending == None:
+            self._pending = _emptyChanges()
+            self._firstPending = time.monotonic()
+        if not self._useLog:
+            self._pending['reload'] = True
+            return()
+        
+        firstId = rm.getFirstChangeId()
+        rows = rm.getReservationsChangesSince(self._lastChangeId, MAX_CHANGES_PER_EVENT + 1)
+        if (firstId != None and firstId > self._lastChangeId + 1) or len(rows) > MAX_CHANGES_PER_EVENT:
+            self._pending['reload'] = True
+            self._lastChangeId = rm.getLastChangeId()
+            with self._lock:
+                self._skipped = set(c for c in self._skipped if c > self._lastChangeId)
+            return()
+        for changeId, reservationId, action in rows:
+            self._lastChangeId = changeId
+            with self._lock:
+                if changeId in self._skipped:
+                    self._skipped.discard(changeId)
+                    continue
+            _mergeChange(self._pending, reservationId, action)
+        return()
+    
+    
+    def _publish(self, changes: dict) -> None:
+        with self._lock:
+            windows = list(self._windows)
+        for window in windows:
+            window.write_event_value(CHANGES_EVENT, changes)
+        return()
+    
+    
+    def stop(self) -> None:
+        self._stopEvent.set()
+        self._thread.join()
+        return()
+
+
+_changeNotifier = None
+
+def startChangeNotifier(interval=0.5, maxDelay=2.0, retention=rm.CHANGES_RETENTION) -> None:
+    global _changeNotifier
+    if _changeNotifier == None:
+        _changeNotifier = ChangeNotifier(interval, maxDelay, retention)
+    return()
+
+
+def stopChangeNotifier() -> None:
+    global _changeNotifier
+    if _changeNotifier != None:
+        _changeNotifier.stop()
+        _changeNotifier = None
+    return()
+
+
+# Windows receive CHANGES_EVENT while subscribed; unsubscribe before closing the window
+def subscribeChanges(window) -> None:
+    if _changeNotifier != None:
+        _changeNotifier.subscribe(window)
+    return()
+
+
+def unsubscribeChanges(window) -> None:
+    if _changeNotifier != None:
+        _changeNotifier.unsubscribe(window)
+    return()
+# End of cross-process change notification --------------------------------------------------------------------------------------------
+
+
+# Raised when a conditional update/delete affected no rows: the reservation was changed or deleted by someone else
+class ReservationConflictError(Exception):
+    def __init__(self, idval) -> None:
+        super().__init__("Reservation {} was changed or deleted by another user.\nReload the reservations and try again.".format(idval))
+        self.idval = idval
+
+
+# Updates the Reservations Window with a delta returned by the CRUD functions below (call from the GUI thread)
+def refreshView(viewRef, delta: tuple) -> None:
+    if delta[0] == DELTA_DELETE:
+        viewRef.pager.rowDeleted()
+    viewRef.refreshTree(delta=delta)
+    return()
+
+
+# The change log entry of a single-row write, made in the current transaction: the write's tree delta patches the
+# Reservations window, so the change notifier does not report it back (which would reload the page and count again)
+def _skipOwnChange() -> None:
+    notifier = _changeNotifier
+    if notifier != None and notifier.usesChangeLog():
+        notifier.skipChange(rm.getLastChangeId())
+    return()
+
+
+# version: the row version read with the reservation (last value of the row tuple), None to skip the check
+def _deleteReservation(idval, version=None) -> tuple:
+    with rm.db.atomic():
+        if rm.deleteReservation(idval, version) == 0:
+            raise ReservationConflictError(idval)
+        _skipOwnChange()
+    return((DELTA_DELETE, reservationKey(idval)))
+
+
+def _updateReservation(idVal, name, gender, passport_num, destination, departure_dt, arrival_dt, version=None) -> tuple:
+    with rm.db.atomic():
+        if rm.updateReservation(idVal, name, gender, passport_num, destination, departure_dt, arrival_dt, version) == 0:
+            raise ReservationConflictError(idVal)
+        _skipOwnChange()
+    if version == None:
+        values = formatReservationRow(rm.getReservation(idVal))
+    else: # The new row is known, no need to read it back
+        values = (int(idVal), name, gender, passport_num, destination, departure_dt, arrival_dt, version + 1)
+    return((DELTA_UPDATE, reservationKey(idVal), values))
+
+
+# Raises ReservationConflictError if version is given and the row was changed or deleted meanwhile
+def deleteReservation(idval, viewRef=None, version=None) -> None:
+    delta = _callDB(_deleteReservation, idval, version)
+    # Remove the row from the Reservations Window Tree
     if viewRef != None:
-        viewRef.treedata = _retrieveReservationsTreeData()
-        viewRef.refreshTree()
+        refreshView(viewRef, delta)
+    return()
+
+
+# Result value is the tree delta, pass it to refreshView()
+def deleteReservationAsync(idval, window, tag='delete', version=None) -> None:
+    submitDBTask(window, tag, _deleteReservation, idval, version)
     return()
 
 
 def createReservation(name, gender, passport_num, destination, departure_dt, arrival_dt) -> None:
-    rm.createReservation(name, gender, passport_num, destination, departure_dt, arrival_dt)
+    _callDB(rm.createReservation, name, gender, passport_num, destination, departure_dt, arrival_dt)
     return()
 
 
-def updateReservation(idVal, name, gender, passport_num, destination, departure_dt, arrival_dt, viewRef=None) -> None:
-    rm.updateReservation(idVal, name, gender, passport_num, destination, departure_dt, arrival_dt)
-    # Update Reservations Window Tree
+def createReservationAsync(name, gender, passport_num, destination, departure_dt, arrival_dt, window, tag='create') -> None:
+    submitDBTask(window, tag, rm.createReservation, name, gender, passport_num, destination, departure_dt, arrival_dt)
+    return()
+
+
+# Bulk create: rows is a list of dicts keyed by Reservations field names, written in one transaction
+def createReservations(rows: list) -> int:
+    count = _callDB(rm.createReservationsBatch, rows)
+    return(count)
+
+
+# Raises ReservationConflictError if version is given and the row was changed or deleted meanwhile
+def updateReservation(idVal, name, gender, passport_num, destination, departure_dt, arrival_dt, viewRef=None, version=None) -> None:
+    delta = _callDB(_updateReservation, idVal, name, gender, passport_num, destination, departure_dt, arrival_dt, version)
+    # Replace the row in the Reservations Window Tree
     if viewRef != None:
-        viewRef.treedata = _retrieveReservationsTreeData()
-        viewRef.refreshTree()
+        refreshView(viewRef, delta)
+    return()
+
+
+# Result value is the tree delta, pass it to refreshView()
+def updateReservationAsync(idVal, name, gender, passport_num, destination, departure_dt, arrival_dt, window, tag='update', version=None) -> None:
+    submitDBTask(window, tag, _updateReservation, idVal, name, gender, passport_num, destination, departure_dt, arrival_dt, version)
+    return()
+
+
+# Bulk operations on a set of reservation_ids, each in one transaction; they return the number of rows changed.
+# The View reloads its current page once afterwards instead of patching rows one by one.
+def deleteReservations(ids: list) -> int:
+    count = _callDB(rm.deleteReservationsBatch, ids)
+    return(count)
+
+
+def deleteReservationsAsync(ids: list, window, tag='bulk_delete') -> None:
+    submitDBTask(window, tag, rm.deleteReservationsBatch, ids)
+    return()
+
+
+# Sets the destination and/or the departure and arrival dates of every reservation in ids; None leaves a field unchanged
+def _reassignFields(destination=None, departure_dt=None, arrival_dt=None) -> dict:
+    fields = {}
+    if destination != None:
+        fields['destination'] = destination
+    if departure_dt != None:
+        fields['departure_dt'] = departure_dt
+    if arrival_dt != None:
+        fields['arrival_dt'] = arrival_dt
+    return(fields)
+
+
+def reassignReservations(ids: list, destination=None, departure_dt=None, arrival_dt=None) -> int:
+    count = _callDB(rm.updateReservationsBatch, ids, _reassignFields(destination, departure_dt, arrival_dt))
+    return(count)
+
+
+def reassignReservationsAsync(ids: list, window, destination=None, departure_dt=None, arrival_dt=None, tag='bulk_edit') -> None:
+    submitDBTask(window, tag, rm.updateReservationsBatch, ids, _reassignFields(destination, departure_dt, arrival_dt))
     return()
 
 
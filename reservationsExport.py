@@ -0,0 +1,103 @@
+# Streaming export of reservations to CSV or JSONL, e.g. for the nightly handoff to downstream systems.
+# Rows are read from a cursor through reservationsController.streamReservations() and written in chunks,
+# so memory use depends on the chunk size, not on the size of the table.
+#
+# Usage: python reservationsExport.py reservations.csv [--destination Tokyo] [--date-from 2030-01-01] [--date-to 2030-01-31]
+#                                     [--archived] [--chunk-size 5000] [--db reservations.db] [--profile fast]
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import reservationsController as rc
+import reservationsModel as rm
+
+
+FIELD_NAMES = ['reservation_id', 'name', 'gender', 'passport_number', 'destination', 'departure_dt', 'arrival_dt', 'version']
+
+
+# Groups an iterable into lists of at most chunkSize items
+def _chunks(rows, chunkSize: int):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunkSize:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def _writeCsv(f, chunks):
+    writer = csv.writer(f)
+    writer.writerow(FIELD_NAMES)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield len(chunk)
+
+
+def _writeJsonl(f, chunks):
+    for chunk in chunks:
+        f.write("".join(json.dumps(dict(zip(FIELD_NAMES, row))) + "\n" for row in chunk))
+        yield len(chunk)
+
+
+# Exports reservations matching filters (see rc.searchReservations()) to filename ("-" for stdout).
+# archived: export the archived (completed) trips instead of the live reservations.
+# Returns a summary dict with the row count, elapsed seconds and rows per second.
+def exportReservations(filename: str, fileFormat=None, filters=None, chunkSize=5000, verbose=True, archived=False) -> dict:
+    if fileFormat == None:
+        fileFormat = os.path.splitext(filename)[1].lstrip('.').lower()
+    if fileFormat == 'csv':
+        writeChunks = _writeCsv
+    elif fileFormat in ('jsonl', 'ndjson'):
+        writeChunks = _writeJsonl
+    else:
+        raise ValueError("Unsupported export format: {}".format(fileFormat))
+
+    stats = {'exported': 0}
+    start = time.perf_counter()
+    f = sys.stdout if filename == '-' else open(filename, 'w', newline='', encoding='utf-8')
+    try:
+        rows = rc.streamArchivedReservations(filters) if archived else rc.streamReservations(filters)
+        chunks = _chunks(rows, chunkSize)
+        for count in writeChunks(f, chunks):
+            stats['exported'] += count
+            if verbose:
+                print("Exported {} rows...".format(stats['exported']), file=sys.stderr)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['rows_per_second'] = stats['exported'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+    return(stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export reservations to a CSV or JSONL file")
+    parser.add_argument('filename', help="Output file, or - for stdout (requires --format)")
+    parser.add_argument('--format', dest='fileFormat', choices=['csv', 'jsonl'], default=None, help="Defaults to the file extension")
+    parser.add_argument('--destination', default=None)
+    parser.add_argument('--date-from', dest='dateFrom', default=None, help="Departures on or after this date")
+    parser.add_argument('--date-to', dest='dateTo', default=None, help="Arrivals on or before this date")
+    parser.add_argument('--archived', action='store_true', help="Export archived trips (see reservationsArchive.py)")
+    parser.add_argument('--chunk-size', dest='chunkSize', type=int, default=5000, help="Rows per write")
+    parser.add_argument('--db', dest='dbPath', default=None, help="Database file (default: RESERVATIONS_DB or reservations.db)")
+    parser.add_argument('--archive-db', dest='archivePath', default=None, help="Archive file (default: RESERVATIONS_ARCHIVE_DB or the database file)")
+    parser.add_argument('--profile', choices=list(rm.DB_PROFILES), default=None, help="Sqlite engine profile")
+    args = parser.parse_args()
+
+    rm.configureDatabase(args.dbPath, args.profile)
+    if args.archivePath != None:
+        rm.configureArchive(args.archivePath)
+    filters = {'destination': args.destination, 'dateFrom': args.dateFrom, 'dateTo': args.dateTo}
+    stats = exportReservations(args.filename, args.fileFormat, filters, args.chunkSize, archived=args.archived)
+    print("Exported: {}  Elapsed: {:.2f}s  ({:.0f} rows/s)".format(stats['exported'], stats['seconds'], stats['rows_per_second']), \
+        file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+# Bulk import of reservations (e.g. airline manifests) from CSV or JSONL files.
+# Records are read as a stream, validated a chunk at a time with reservationsValidation (the same rules as the
+# reservations form), and valid records are written one transaction per chunk via the reservationsController.
+# Memory use depends on the chunk size, not on the size of the file.
+#
+# Usage: python reservationsImport.py manifest.csv [--chunk-size 1000] [--rejects rejects.jsonl] [--db reservations.db] [--profile fast]
+#
+# Each record must provide the Reservations fields:
+#   name, gender, passport_number, destination, departure_dt, arrival_dt
+# with dates formatted as "%Y-%m-%d %H:%M:%S".
+
+import argparse
+import csv
+import json
+import os
+import time
+from datetime import datetime
+import reservationsController as rc
+import reservationsModel as rm
+import reservationsValidation as rv
+
+
+FIELD_NAMES = rv.FIELD_NAMES
+
+
+# Generators yielding (line number, record dict) ---------------------------------------------------------------------------------
+def _readCsv(filename: str):
+    with open(filename, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for record in reader:
+            yield (reader.line_num, record)
+
+
+def _readJsonl(filename: str):
+    with open(filename, encoding='utf-8') as f:
+        lineNum = 0
+        for line in f:
+            lineNum += 1
+            if len(line.strip()) == 0:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                record = {'_error': "Invalid JSON: {}".format(e)}
+            yield (lineNum, record)
+
+
+def readRecords(filename: str, fileFormat=None):
+    if fileFormat == None:
+        fileFormat = os.path.splitext(filename)[1].lstrip('.').lower()
+    if fileFormat == 'csv':
+        return(_readCsv(filename))
+    elif fileFormat in ('jsonl', 'json', 'ndjson'):
+        return(_readJsonl(filename))
+    raise ValueError("Unsupported import format: {}".format(fileFormat))
+# End of generators ---------------------------------------------------------------------------------------------------------------
+
+
+# Validates a chunk of (line number, record) pairs with reservationsValidation.validateBatch().
+# Returns (list of valid row dicts, list of (line number, record, error messages))
+def _validateChunk(pending: list, destinations: set, now: datetime) -> tuple[list, list]:
+    rejected = []
+    lineNums = []
+    records = []
+    for lineNum, record in pending:
+        if not isinstance(record, dict):
+            rejected.append((lineNum, record, ['Record is not an object']))
+        elif '_error' in record:
+            rejected.append((lineNum, record, [record['_error']]))
+        else:
+            lineNums.append(lineNum)
+            records.append(record)
+
+    columns = {field: [record.get(field) for record in records] for field in FIELD_NAMES}
+    rows, errors = rv.validateBatch(columns, now, destinations)
+
+    valid = []
+    for n in range(len(records)):
+        if len(errors[n]) > 0:
+            rejected.append((lineNums[n], records[n], [e['message'] for e in errors[n]]))
+        else:
+            valid.append({field: rows[field][n] for field in FIELD_NAMES})
+    return(valid, rejected)
+
+
+# Streams records from filename into the reservations database.
+# Rejected records are written to rejectsFile (JSONL) when given.
+# Returns a summary dict with counts, elapsed seconds and rows per second.
+def importReservations(filename: str, chunkSize=1000, fileFormat=None, rejectsFile=None, verbose=True) -> dict:
+    destinations = set(str(e[0]).strip() for e in rc.retrieveDestinations())
+    now = datetime.now()
+
+    stats = {'read': 0, 'imported': 0, 'rejected': 0}
+    rejects = open(rejectsFile, 'w', encoding='utf-8') if rejectsFile != None else None
+    start = time.perf_counter()
+
+    def processChunk(pending: list) -> None:
+        valid, rejected = _validateChunk(pending, destinations, now)
+        for lineNum, record, errors in rejected:
+            stats['rejected'] += 1
+            if rejects != None:
+                rejects.write(json.dumps({'line': lineNum, 'errors': errors, 'record': record}) + "\n")
+            elif verbose and stats['rejected'] <= 10:
+                print("Rejected line {}: {}".format(lineNum, "; ".join(errors)))
+        if len(valid) > 0:
+            stats['imported'] += rc.createReservations(valid)
+        if verbose:
+            print("Imported {} rows...".format(stats['imported']))
+
+    try:
+        pending = []
+        for lineNum, record in readRecords(filename, fileFormat):
+            stats['read'] += 1
+            pending.append((lineNum, record))
+            if len(pending) >= chunkSize:
+                processChunk(pending)
+                pending = []
+        if len(pending) > 0:
+            processChunk(pending)
+    finally:
+        if rejects != None:
+            rejects.close()
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['rows_per_second'] = stats['imported'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+    return(stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import reservations from a CSV or JSONL file")
+    parser.add_argument('filename')
+    parser.add_argument('--format', dest='fileFormat', choices=['csv', 'jsonl'], default=None, help="Defaults to the file extension")
+    parser.add_argument('--chunk-size', dest='chunkSize', type=int, default=1000, help="Rows per transaction")
+    parser.add_argument('--rejects', dest='rejectsFile', default=None, help="Write rejected records to this JSONL file")
+    parser.add_argument('--db', dest='dbPath', default=None, help="Database file (default: RESERVATIONS_DB or reservations.db)")
+    parser.add_argument('--profile', choices=list(rm.DB_PROFILES), default=None, help="Sqlite engine profile")
+    args = parser.parse_args()
+
+    rm.configureDatabase(args.dbPath, args.profile)
+    stats = importReservations(args.filename, args.chunkSize, args.fileFormat, args.rejectsFile)
+    print()
+    print("Read: {}  Imported: {}  Rejected: {}".format(stats['read'], stats['imported'], stats['rejected']))
+    print("Elapsed: {:.2f}s  ({:.0f} rows/s)".format(stats['seconds'], stats['rows_per_second']))
+
+
+if __name__ == '__main__':
+    main()
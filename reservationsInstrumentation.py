@@ -0,0 +1,219 @@
+# Opt-in instrumentation for the reservations app.
+# Records wall time and call counts for every reservationsController function (and any other functions
+# registered with instrument()), the SQL statements each call issues through peewee, and logs slow queries.
+# Instrumentation works by wrapping the module/class attributes when enable() is called and restoring them
+# in disable(), so there is no overhead at all while it is disabled.
+#
+# Enable from the environment: RESERVATIONS_INSTRUMENT=1 [RESERVATIONS_SLOW_QUERY_MS=50] [RESERVATIONS_INSTRUMENT_EXPORT=stats.json]
+# or call enable() directly. A summary is printed (and exported) on exit.
+
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+import reservationsModel as rm
+import reservationsController as rc
+
+
+slowQueryLog = logging.getLogger('reservations.slowquery')
+
+# DB worker plumbing, query cache plumbing and per-row helpers are not timed, the work they run is
+_SKIP_CONTROLLER_FUNCTIONS = {'startDBWorker', 'stopDBWorker', 'isDBWorkerRunning', '_callDB', '_postResult', 'submitDBTask', 'main', \
+    'reservationKey', 'formatReservationRow', 'formatDateTime', 'retrieveDestinationCity', 'cachedQuery', '_freeze', '_dataStamp', \
+    'getQueryCacheStats'}
+MAX_SLOW_QUERIES = 100
+
+_lock = threading.Lock()
+# Instrumented calls in progress; a context variable so calls handed to the controller's DB worker
+# count their SQL towards the caller
+_activeCalls = contextvars.ContextVar('reservationsActiveCalls', default=())
+_patched = [] # (owner, name, original) restored by disable()
+_settings = {'enabled': False, 'slowQueryMs': 50.0, 'exportPath': None, 'atexit': False}
+_stats = {'functions': {}, 'sql': {'statements': 0, 'total_ms': 0.0}, 'slow_queries': deque(maxlen=MAX_SLOW_QUERIES)}
+
+
+def _functionStats(label: str) -> dict:
+    stats = _stats['functions'].get(label)
+    if stats == None:
+        stats = {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'queries': 0, 'query_ms': 0.0}
+        _stats['functions'][label] = stats
+    return(stats)
+
+
+def _wrapFunction(func, label: str):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        frame = {'label': label, 'queries': 0, 'query_ms': 0.0}
+        token = _activeCalls.set(_activeCalls.get() + (frame,))
+        start = time.perf_counter()
+        try:
+            return(func(*args, **kwargs))
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            _activeCalls.reset(token)
+            with _lock:
+                stats = _functionStats(label)
+                stats['calls'] += 1
+                stats['total_ms'] += elapsed
+                stats['max_ms'] = max(stats['max_ms'], elapsed)
+                stats['queries'] += frame['queries']
+                stats['query_ms'] += frame['query_ms']
+    return(wrapper)
+
+
+def _wrapExecuteSql(executeSql):
+    # Times statement execution; fetching the rows of a SELECT is part of the calling function's time
+    @functools.wraps(executeSql)
+    def wrapper(sql, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return(executeSql(sql, params, *args, **kwargs))
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            stack = _activeCalls.get()
+            with _lock:
+                # Statements count towards every instrumented call in progress (inclusive, like the wall time)
+                for frame in stack:
+                    frame['queries'] += 1
+                    frame['query_ms'] += elapsed
+                _stats['sql']['statements'] += 1
+                _stats['sql']['total_ms'] += elapsed
+                if elapsed >= _settings['slowQueryMs']:
+                    caller = stack[-1]['label'] if len(stack) > 0 else None
+                    _stats['slow_queries'].append({'ms': round(elapsed, 3), 'sql': sql, 'params': [str(p) for p in (params or [])], 'caller': caller})
+                    slowQueryLog.warning("%.1f ms (%s): %s %s", elapsed, caller, sql, params)
+    return(wrapper)
+
+
+def _patch(owner, name: str, replacement) -> None:
+    _patched.append((owner, name, owner.__dict__[name]))
+    setattr(owner, name, replacement)
+    return()
+
+
+# Wraps the functions (or methods, for a class) called names on owner; label defaults to owner.name
+def instrument(owner, names: list, prefix=None) -> None:
+    if not _settings['enabled']:
+        return()
+    prefix = prefix if prefix != None else getattr(owner, '__name__', str(owner))
+    for name in names:
+        _patch(owner, name, _wrapFunction(getattr(owner, name), "{}.{}".format(prefix, name)))
+    return()
+
+
+def _controllerFunctionNames() -> list:
+    names = []
+    for name, value in vars(rc).items():
+        if inspect.isfunction(value) and value.__module__ == rc.__name__ and name not in _SKIP_CONTROLLER_FUNCTIONS:
+            names.append(name)
+    return(names)
+
+
+def _classMethodNames(cls) -> list:
+    return([name for name, value in vars(cls).items() if inspect.isfunction(value)])
+
+
+def enable(slowQueryMs=50.0, exportPath=None) -> None:
+    if _settings['enabled']:
+        return()
+    _settings['enabled'] = True
+    _settings['slowQueryMs'] = slowQueryMs
+    _settings['exportPath'] = exportPath
+
+    instrument(rc, _controllerFunctionNames(), 'rc')
+    instrument(rc.ReservationsPager, _classMethodNames(rc.ReservationsPager), 'rc.ReservationsPager')
+    rm.db.execute_sql = _wrapExecuteSql(rm.db.execute_sql) # Instance attribute shadows SqliteDatabase.execute_sql
+
+    if not _settings['atexit']:
+        atexit.register(_dumpOnExit)
+        _settings['atexit'] = True
+    return()
+
+
+def disable() -> None:
+    while len(_patched) > 0:
+        owner, name, original = _patched.pop()
+        setattr(owner, name, original)
+    if 'execute_sql' in vars(rm.db):
+        del rm.db.execute_sql
+    _settings['enabled'] = False
+    return()
+
+
+def enableFromEnvironment() -> bool:
+    if os.environ.get('RESERVATIONS_INSTRUMENT', '') not in ('', '0'):
+        enable(float(os.environ.get('RESERVATIONS_SLOW_QUERY_MS', 50)), os.environ.get('RESERVATIONS_INSTRUMENT_EXPORT'))
+    return(_settings['enabled'])
+
+
+def isEnabled() -> bool:
+    return(_settings['enabled'])
+
+
+def reset() -> None:
+    with _lock:
+        _stats['functions'].clear()
+        _stats['sql']['statements'] = 0
+        _stats['sql']['total_ms'] = 0.0
+        _stats['slow_queries'].clear()
+    return()
+
+
+def getSummary() -> dict:
+    with _lock:
+        functions = {}
+        for label, stats in _stats['functions'].items():
+            functions[label] = {
+                'calls': stats['calls'],
+                'total_ms': round(stats['total_ms'], 3),
+                'mean_ms': round(stats['total_ms'] / stats['calls'], 3),
+                'max_ms': round(stats['max_ms'], 3),
+                'queries': stats['queries'],
+                'queries_per_call': round(stats['queries'] / stats['calls'], 2),
+                'query_ms': round(stats['query_ms'], 3),
+            }
+        summary = {
+            'functions': functions,
+            'sql': {'statements': _stats['sql']['statements'], 'total_ms': round(_stats['sql']['total_ms'], 3)},
+            'slow_query_ms': _settings['slowQueryMs'],
+            'slow_queries': list(_stats['slow_queries']),
+        }
+    summary['query_cache'] = rc.getQueryCacheStats()
+    return(summary)
+
+
+def exportSummary(path: str) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(getSummary(), f, indent=2)
+    return()
+
+
+def printSummary(file=sys.stderr) -> None:
+    summary = getSummary()
+    print("{:<45} {:>7} {:>11} {:>10} {:>10} {:>9} {:>10}".format('Function', 'Calls', 'Total ms', 'Mean ms', 'Max ms', 'Queries', 'Query ms'), file=file)
+    ordered = sorted(summary['functions'].items(), key=lambda item: item[1]['total_ms'], reverse=True)
+    for label, stats in ordered:
+        print("{:<45} {:>7} {:>11.1f} {:>10.3f} {:>10.3f} {:>9} {:>10.1f}".format(label, stats['calls'], stats['total_ms'], \
+            stats['mean_ms'], stats['max_ms'], stats['queries'], stats['query_ms']), file=file)
+    print("SQL statements: {}  ({:.1f} ms)  slow (>= {} ms): {}".format(summary['sql']['statements'], summary['sql']['total_ms'], \
+        summary['slow_query_ms'], len(summary['slow_queries'])), file=file)
+    cache = summary['query_cache']
+    print("Query cache: {} hits, {} misses ({} stale), hit rate {:.1%}, {}/{} entries, {} evictions".format(cache['hits'], \
+        cache['misses'], cache['stale'], cache['hit_rate'], cache['entries'], cache['max_entries'], cache['evictions']), file=file)
+    return()
+
+
+def _dumpOnExit() -> None:
+    if not _settings['enabled']:
+        return()
+    printSummary()
+    if _settings['exportPath'] != None:
+        exportSummary(_settings['exportPath'])
+    return()
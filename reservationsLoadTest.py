@@ -0,0 +1,212 @@
+# Multi-process write load test for the reservations database.
+# Spawns N worker processes that call rm.createReservation, rm.updateReservation and rm.deleteReservation in a
+# configurable mix against one Sqlite file, the way several GUI instances and batch jobs share reservations.db.
+# Every combination of journal mode, busy timeout and worker count gets a freshly seeded database and reports
+# throughput, p50/p95/p99 commit latency and "database is locked" errors as JSON, for capacity planning.
+#
+# Usage: python reservationsLoadTest.py [--workers 1 2 4 8] [--duration 10] [--mix create=50 update=30 delete=20]
+#                                       [--journal-modes wal delete] [--busy-timeouts 0 100 5000] [--seed-rows 10000]
+#                                       [--profile durable] [--output load.json]
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+from peewee import OperationalError
+import reservationsBenchmark as rb
+import reservationsModel as rm
+
+
+JOURNAL_MODES = ['wal', 'delete', 'truncate', 'persist']
+OPERATIONS = ['create', 'update', 'delete']
+DESTINATIONS = ['Havana', 'Moscow', 'Beijing', 'London', 'Tokyo', 'Paris']
+
+
+# Worker process -----------------------------------------------------------------------------------------------------------------
+# Each operation returns the number of rows written; 0 means the row was already deleted by another worker
+def _create(rnd, worker: int, n: int) -> int:
+    rm.createReservation('Load Worker {}'.format(worker), rnd.choice(('Male', 'Female')), 'L{:02d}{:07d}'.format(worker, n), \
+        rnd.choice(DESTINATIONS), '2099-01-01 10:00:00', '2099-01-01 18:00:00')
+    return(1)
+
+
+def _update(rnd, worker: int, n: int, maxId: int) -> int:
+    return(rm.updateReservation(rnd.randint(1, maxId), 'Load Update {}'.format(worker), rnd.choice(('Male', 'Female')), \
+        'U{:02d}{:07d}'.format(worker, n), rnd.choice(DESTINATIONS), '2099-02-01 10:00:00', '2099-02-01 18:00:00'))
+
+
+def _delete(rnd, worker: int, n: int, maxId: int) -> int:
+    return(rm.deleteReservation(rnd.randint(1, maxId)))
+
+
+def _isLockError(error: Exception) -> bool:
+    message = str(error).lower()
+    return('locked' in message or 'busy' in message)
+
+
+# Runs the operation mix for duration seconds once start is set; results go to the queue as a dict of
+# per-operation latency samples (ms, successful calls) and error counts.
+def _worker(worker: int, path: str, profile: str, pragmas: dict, mix: dict, duration: float, maxId: int, start, results) -> None:
+    rm.configureDatabase(path, profile, **pragmas)
+    rnd = random.Random(1000 + worker)
+    operations = list(mix)
+    weights = [mix[op] for op in operations]
+    samples = {op: [] for op in operations}
+    errors = {op: {'locked': 0, 'missed': 0, 'other': 0} for op in operations}
+
+    start.wait()
+    deadline = time.perf_counter() + duration
+    n = 0
+    while time.perf_counter() < deadline:
+        n += 1
+        op = rnd.choices(operations, weights)[0]
+        callStart = time.perf_counter()
+        try:
+            if op == 'create':
+                count = _create(rnd, worker, n)
+            elif op == 'update':
+                count = _update(rnd, worker, n, maxId)
+            else:
+                count = _delete(rnd, worker, n, maxId)
+        except OperationalError as e:
+            errors[op]['locked' if _isLockError(e) else 'other'] += 1
+            if not rm.db.is_closed() and rm.db.in_transaction():
+                rm.db.rollback()
+            continue
+        samples[op].append((time.perf_counter() - callStart) * 1000)
+        if count == 0:
+            errors[op]['missed'] += 1
+    rm.db.close()
+    results.put({'worker': worker, 'samples': samples, 'errors': errors})
+# End of worker process ----------------------------------------------------------------------------------------------------------
+
+
+def _latencyStats(samples: list) -> dict:
+    if len(samples) == 0:
+        return({'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'max_ms': None})
+    stats = {
+        'p50_ms': round(rb._percentile(samples, 50), 3),
+        'p95_ms': round(rb._percentile(samples, 95), 3),
+        'p99_ms': round(rb._percentile(samples, 99), 3),
+        'max_ms': round(max(samples), 3),
+    }
+    return(stats)
+
+
+# Seeds a new database in tmpDir and switches it to journalMode before the workers connect
+# (leaving WAL needs the only connection to the file). Returns (path, highest reservation_id).
+def _prepareDatabase(tmpDir: str, seedRows: int, profile: str, journalMode: str) -> tuple:
+    path = os.path.join(tmpDir, 'reservations_load_{}.db'.format(journalMode))
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    rb.seedDatabase(path, seedRows, profile)
+    rm.configureDatabase(path, profile, journal_mode=journalMode)
+    rm.db.connect()
+    maxId = rm.db.execute_sql('SELECT max(reservation_id) FROM reservations').fetchone()[0] or 1
+    rm.db.close()
+    return(path, maxId)
+
+
+def runLoad(path: str, maxId: int, workers: int, duration: float, mix: dict, profile: str, pragmas: dict) -> dict:
+    context = multiprocessing.get_context('spawn') # Fresh interpreter per worker, as with separate GUI instances
+    start = context.Event()
+    results = context.Queue()
+    processes = [context.Process(target=_worker, args=(n, path, profile, pragmas, mix, duration, maxId, start, results)) \
+        for n in range(workers)]
+    for process in processes:
+        process.start()
+    time.sleep(0.5) # Let the workers import and connect before the clock starts
+    start.set()
+    outcomes = [results.get() for process in processes]
+    for process in processes:
+        process.join()
+
+    run = {'ops': 0, 'by_operation': {}}
+    allSamples = []
+    locked = 0
+    for op in mix:
+        samples = [ms for outcome in outcomes for ms in outcome['samples'][op]]
+        errors = {kind: sum(outcome['errors'][op][kind] for outcome in outcomes) for kind in ('locked', 'missed', 'other')}
+        run['by_operation'][op] = dict({'ops': len(samples), 'ops_per_s': round(len(samples) / duration, 1)}, \
+            **_latencyStats(samples), **errors)
+        allSamples.extend(samples)
+        locked += errors['locked']
+    run['ops'] = len(allSamples)
+    run['ops_per_s'] = round(len(allSamples) / duration, 1)
+    run.update(_latencyStats(allSamples))
+    run['locked_errors'] = locked
+    run['locked_rate'] = round(locked / (len(allSamples) + locked), 4) if len(allSamples) + locked > 0 else 0.0
+    return(run)
+
+
+def _parseMix(items: list) -> dict:
+    mix = {}
+    for item in items:
+        op, _, weight = item.partition('=')
+        if op not in OPERATIONS:
+            raise ValueError("Unknown operation in --mix: {} (expected one of {})".format(op, ", ".join(OPERATIONS)))
+        mix[op] = float(weight) if len(weight) > 0 else 1.0
+    return({op: weight for op, weight in mix.items() if weight > 0})
+
+
+def _printRun(run: dict, file=sys.stderr) -> None:
+    print("{:<9} {:>8} {:>8} {:>10} {:>9} {:>9} {:>9} {:>9} {:>8}".format(run['journal_mode'], run['busy_timeout_ms'], run['workers'], \
+        run['ops_per_s'], run['p50_ms'] or 0, run['p95_ms'] or 0, run['p99_ms'] or 0, run['max_ms'] or 0, run['locked_errors']), file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent multi-process write load test for the reservations database")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help="Worker process counts to test")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per run")
+    parser.add_argument('--mix', nargs='+', default=['create=50', 'update=30', 'delete=20'], help="Operation weights, e.g. create=50")
+    parser.add_argument('--journal-modes', dest='journalModes', nargs='+', choices=JOURNAL_MODES, default=['wal', 'delete'])
+    parser.add_argument('--busy-timeouts', dest='busyTimeouts', type=int, nargs='+', default=[0, 100, 5000], help="busy_timeout values (ms)")
+    parser.add_argument('--seed-rows', dest='seedRows', type=int, default=10000, help="Reservations in the database before each run")
+    parser.add_argument('--profile', choices=list(rm.DB_PROFILES), default=None, help="Sqlite engine profile")
+    parser.add_argument('--output', default=None, help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    mix = _parseMix(args.mix)
+    profile = args.profile or rm.DB_PROFILE
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'cpus': os.cpu_count(),
+        'profile': profile,
+        'mix': mix,
+        'duration_s': args.duration,
+        'runs': [],
+    }
+
+    print("{:<9} {:>8} {:>8} {:>10} {:>9} {:>9} {:>9} {:>9} {:>8}".format('Journal', 'Busy ms', 'Workers', 'Ops/s', 'p50 ms', 'p95 ms', \
+        'p99 ms', 'Max ms', 'Locked'), file=sys.stderr)
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for journalMode in args.journalModes:
+            for busyTimeout in args.busyTimeouts:
+                for workers in args.workers:
+                    path, maxId = _prepareDatabase(tmpDir, args.seedRows, profile, journalMode)
+                    pragmas = {'journal_mode': journalMode, 'busy_timeout': busyTimeout}
+                    run = {'journal_mode': journalMode, 'busy_timeout_ms': busyTimeout, 'workers': workers}
+                    run.update(runLoad(path, maxId, workers, args.duration, mix, profile, pragmas))
+                    report['runs'].append(run)
+                    _printRun(run)
+
+    text = json.dumps(report, indent=2)
+    if args.output == None:
+        print(text)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+
+
+if __name__ == '__main__':
+    main()
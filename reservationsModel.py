@@ -1,42 +1,590 @@
 # Uses the peewee ORM classes/methods to create and manage Sqlite tables for reservation.db
 # Provides low level CRUD methods for reservations.db
 
+import os
+import pathlib
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
 from peewee import *
+from playhouse.sqlite_ext import AutoIncrementField, FTS5Model, RowIDField, SearchField
+
+# Sqlite engine profiles: pragmas applied by peewee on every new connection -------------------------------------------------------------
+# Both profiles use WAL journaling so clerks can keep reading while one of them writes, and incremental
+# auto-vacuum so compactDatabase() can return the space freed by archiving. auto_vacuum only takes effect
+# on a new database; compactDatabase(full=True) converts an existing one.
+DB_PROFILES = {
+    'durable': {
+        'auto_vacuum': 'incremental',
+        'journal_mode': 'wal',
+        'synchronous': 'full',      # fsync on every commit
+        'cache_size': -16000,       # 16MB page cache
+        'mmap_size': 0,
+        'temp_store': 'default',
+        'busy_timeout': 5000,       # ms to wait for a lock before "database is locked"
+        'foreign_keys': 1,          # Reservations.destination must name a Destinations row
+    },
+    'fast': {
+        'auto_vacuum': 'incremental',
+        'journal_mode': 'wal',
+        'synchronous': 'normal',    # WAL stays consistent; the last commits may be lost on power failure
+        'cache_size': -64000,       # 64MB page cache
+        'mmap_size': 268435456,     # 256MB memory-mapped I/O
+        'temp_store': 'memory',
+        'busy_timeout': 5000,
+        'foreign_keys': 1,
+    },
+}
+
+# Database file and profile can be set from the environment or with configureDatabase()
+DB_PATH = os.environ.get('RESERVATIONS_DB', 'reservations.db')
+DB_PROFILE = os.environ.get('RESERVATIONS_DB_PROFILE', 'durable')
+
+
+def _getPragmas(profile: str, overrides: dict) -> dict:
+    if profile not in DB_PROFILES:
+        raise ValueError("Unknown database profile: {} (expected one of {})".format(profile, ", ".join(DB_PROFILES)))
+    pragmas = dict(DB_PROFILES[profile])
+    pragmas.update(overrides)
+    return(pragmas)
+
+
+# Date storage ---------------------------------------------------------------------------------------------------------------------------
+# Reservations.departure_dt and arrival_dt are stored either as "%Y-%m-%d %H:%M:%S" text ('text', the original
+# format) or as integer seconds since 1970-01-01 00:00:00 ('epoch'). Epoch values count the same wall-clock time,
+# no time zone conversion is made. Integers make the date indexes smaller and range filters cheaper to compare,
+# and writes store them without formatting a datetime back into text. Row tuples carry the stored value; the controller formats the
+# dates of the rows it displays (see rc.formatDateTime()).
+# An existing database keeps its storage: it is read from the declared type of reservations.departure_dt before the
+# first query and again whenever a connection opens. New databases use RESERVATIONS_DATE_STORAGE or
+# configureDatabase(dateStorage=...).
+# migrateDateStorage() converts an existing database.
+DATE_STORAGES = ('text', 'epoch')
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_dateStorage = {'default': os.environ.get('RESERVATIONS_DATE_STORAGE', 'text'), 'mode': None} # mode None: not read yet
+
+
+def _checkDateStorage(storage: str) -> str:
+    if storage not in DATE_STORAGES:
+        raise ValueError("Unknown date storage: {} (expected one of {})".format(storage, ", ".join(DATE_STORAGES)))
+    return(storage)
+
+
+# Storage of the configured database ('text' or 'epoch'). Query parameters are converted before peewee opens its
+# connection, so the first call reads the storage through a short-lived read-only connection.
+def getDateStorage() -> str:
+    if _dateStorage['mode'] == None:
+        storage = None
+        try:
+            conn = sqlite3.connect('{}?mode=ro'.format(pathlib.Path(DB_PATH).resolve().as_uri()), uri=True)
+            try:
+                storage = _readDateStorage(conn)
+            finally:
+                conn.close()
+        except sqlite3.Error: # No database file yet
+            pass
+        _dateStorage['mode'] = _dateStorage['default'] if storage == None else storage
+    return(_dateStorage['mode'])
+
+
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+
+# "%Y-%m-%d %H:%M:%S" text (fractional seconds are dropped) or a "%Y-%m-%d" date to epoch seconds
+def textToEpoch(text: str) -> int:
+    return(datetimeToEpoch(datetime.fromisoformat(text)))
+
+
+def datetimeToEpoch(value: datetime) -> int:
+    return((value.toordinal() - _EPOCH_ORDINAL) * 86400 + value.hour * 3600 + value.minute * 60 + value.second)
+
+
+# Formatting cost is per displayed row: the date part is formatted once per day and cached
+_epochDays = {}
+
+def epochToText(value: int) -> str:
+    days, seconds = divmod(value, 86400)
+    day = _epochDays.get(days)
+    if day == None:
+        if len(_epochDays) > 10000:
+            _epochDays.clear()
+        day = _epochDays[days] = time.strftime("%Y-%m-%d ", time.gmtime(days * 86400))
+    return(day + "%02d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60))
+
+
+# DateTimeField whose column type and stored values follow the database's date storage
+class ReservationDateTimeField(DateTimeField):
+    @property
+    def field_type(self):
+        return('INTEGER' if getDateStorage() == 'epoch' else 'DATETIME')
+
+    def db_value(self, value):
+        if value == None or isinstance(value, int) or getDateStorage() != 'epoch':
+            return(super().db_value(value))
+        if isinstance(value, datetime):
+            return(datetimeToEpoch(value))
+        return(textToEpoch(str(value)))
+
+    def python_value(self, value):
+        if isinstance(value, int):
+            return(datetime(1970, 1, 1) + timedelta(seconds=value))
+        return(super().python_value(value))
+
+
+# Declared type of a table's departure_dt column -> date storage; None when the table does not exist
+def _readDateStorage(conn, table='reservations', schema='main') -> str:
+    row = conn.execute("SELECT type FROM pragma_table_info(?, ?) WHERE name = 'departure_dt'", (table, schema)).fetchone()
+    if row == None:
+        return(None)
+    return('epoch' if row[0].upper() == 'INTEGER' else 'text')
+
+
+# Adds Reservations.version to a database created before it existed; existing rows read as version 1
+def _addVersionColumn(conn, table='reservations') -> None:
+    columns = [row[0] for row in conn.execute("SELECT name FROM pragma_table_info(?)", (table,))]
+    if len(columns) == 0 or 'version' in columns:
+        return()
+    try:
+        conn.execute('ALTER TABLE "{}" ADD COLUMN "version" INTEGER NOT NULL DEFAULT 1'.format(table))
+    except sqlite3.OperationalError: # Added by another process meanwhile, or a read-only file
+        pass
+    return()
+
+
+# Reads the date storage of the database on every new connection, and adds the version column when it is missing
+class ReservationsDatabase(SqliteDatabase):
+    def _initialize_connection(self, conn):
+        super()._initialize_connection(conn)
+        _addVersionColumn(conn)
+        storage = _readDateStorage(conn)
+        _dateStorage['mode'] = _dateStorage['default'] if storage == None else storage
+# End of date storage --------------------------------------------------------------------------------------------------------------------
+
 
 # ORM Classes and methods to manage corresponding Sqlite tables for reservations.db --------------------------------------------------------------
-db = SqliteDatabase("reservations.db")
+db = ReservationsDatabase(DB_PATH, pragmas=_getPragmas(DB_PROFILE, {}))
+
+
+# Point the model at another database file and/or engine profile; pragmas override individual profile settings.
+# dateStorage: date storage for a new database ('text' or 'epoch'), an existing database keeps its own
+def configureDatabase(path=None, profile=None, dateStorage=None, **pragmas) -> None:
+    global DB_PATH, DB_PROFILE
+    DB_PATH = DB_PATH if path == None else path
+    DB_PROFILE = DB_PROFILE if profile == None else profile
+    if dateStorage != None:
+        _dateStorage['default'] = _checkDateStorage(dateStorage)
+    _dateStorage['mode'] = None
+    if not db.is_closed():
+        db.close()
+    db.init(DB_PATH, pragmas=_getPragmas(DB_PROFILE, pragmas))
+    _reservationsChanged() # Results cached for the previous file are stale
+    _destinationsChanged()
 
 class BaseModel(Model):
     class Meta:
         database = db
 
 
+class Destinations(BaseModel):
+    destination_id = AutoField(primary_key = True, verbose_name = 'Destination Id')
+    city = CharField(null = False, unique = True, verbose_name='City')
+    country = CharField(null = True, verbose_name='Country')
+
+
 class Reservations(BaseModel):
     reservation_id = AutoField(primary_key = True, verbose_name = 'Reservation Id') 
     name = CharField(null = False, verbose_name='Name')
     gender = CharField(null = False, verbose_name='Gender')
     passport_number = CharField(null = False, verbose_name = 'Passport #')
+    # Stored as destination_id; writes take the city (see _destinationValue()), row tuples carry the id and the
+    # controller shows the city. Indexed by the (destination, departure_dt) index below.
+    destination = ForeignKeyField(Destinations, column_name = 'destination_id', field = Destinations.destination_id, \
+        null = False, index = False, lazy_load = False, verbose_name='Destination')
+    departure_dt = ReservationDateTimeField(null = False, verbose_name = 'Departure Date/Time')
+    arrival_dt = ReservationDateTimeField(null = False, verbose_name = 'Arrival Date/Time')
+    # Row version for optimistic concurrency, incremented by every updateReservation()
+    version = IntegerField(null = False, default = 1, constraints = [SQL('DEFAULT 1')], verbose_name = 'Version')
+
+    # Secondary indexes backing findReservations() and the filtered pages
+    class Meta:
+        indexes = (
+            (('passport_number',), False),
+            (('name',), False),
+            (('destination', 'departure_dt'), False),
+            (('departure_dt',), False),
+            (('arrival_dt',), False),
+        )
+
+
+# FTS5 full-text index over Reservations.name and passport_number for passenger search.
+# External content table: the text is read from reservations, the index is kept in sync by the triggers below.
+# The trigram tokenizer (Sqlite 3.34+) matches any fragment of 3 or more characters, case-insensitively.
+class ReservationsSearch(FTS5Model):
+    rowid = RowIDField()
+    name = SearchField()
+    passport_number = SearchField()
+
+    class Meta:
+        database = db
+        table_name = 'reservations_search'
+        options = {'content': Reservations, 'content_rowid': Reservations.reservation_id, 'tokenize': 'trigram'}
+
+
+_SEARCH_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS reservations_search_ai AFTER INSERT ON reservations BEGIN
+        INSERT INTO reservations_search(rowid, name, passport_number) VALUES (new.reservation_id, new.name, new.passport_number);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS reservations_search_ad AFTER DELETE ON reservations BEGIN
+        INSERT INTO reservations_search(reservations_search, rowid, name, passport_number)
+            VALUES ('delete', old.reservation_id, old.name, old.passport_number);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS reservations_search_au AFTER UPDATE OF name, passport_number ON reservations BEGIN
+        INSERT INTO reservations_search(reservations_search, rowid, name, passport_number)
+            VALUES ('delete', old.reservation_id, old.name, old.passport_number);
+        INSERT INTO reservations_search(rowid, name, passport_number) VALUES (new.reservation_id, new.name, new.passport_number);
+    END""",
+]
+
+
+def _createReservationsSearch() -> None:
+    db.create_tables([ReservationsSearch])
+    for trigger in _SEARCH_TRIGGERS:
+        db.execute_sql(trigger)
+
+
+# Change log: one row per inserted, updated or deleted reservation, written by the triggers below in the same
+# transaction as the change. Lets every process (e.g. the controller's change notifier) work out which reservations
+# changed since it last looked, whichever process made the change. change_id is AUTOINCREMENT so ids are never
+# reused after pruneReservationsChanges().
+CHANGES_RETENTION = 3600 # Seconds change log entries are kept
+
+class ReservationsChanges(BaseModel):
+    change_id = AutoIncrementField(verbose_name = 'Change Id')
+    reservation_id = IntegerField(null = False, verbose_name = 'Reservation Id')
+    action = CharField(null = False, verbose_name = 'Action') # 'insert', 'update' or 'delete'
+    changed_dt = DateTimeField(null = False, constraints = [SQL('DEFAULT CURRENT_TIMESTAMP')], verbose_name = 'Changed Date/Time (UTC)')
+
+    class Meta:
+        table_name = 'reservations_changes'
+
+
+_CHANGE_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS reservations_changes_ai AFTER INSERT ON reservations BEGIN
+        INSERT INTO reservations_changes(reservation_id, action) VALUES (new.reservation_id, 'insert');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS reservations_changes_au AFTER UPDATE ON reservations BEGIN
+        INSERT INTO reservations_changes(reservation_id, action) VALUES (new.reservation_id, 'update');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS reservations_changes_ad AFTER DELETE ON reservations BEGIN
+        INSERT INTO reservations_changes(reservation_id, action) VALUES (old.reservation_id, 'delete');
+    END""",
+]
+
+
+def _createReservationsChanges() -> None:
+    db.create_tables([ReservationsChanges])
+    for trigger in _CHANGE_TRIGGERS:
+        db.execute_sql(trigger)
+
+
+# Completed trips moved out of Reservations by archiveReservationsBatch(), so the live table and its indexes only
+# hold current bookings. Stored in the main database file, or in a separate file attached as schema "archive"
+# (see configureArchive()). reservation_id is not unique here: Sqlite may reuse the id of an archived row.
+class ReservationsArchive(BaseModel):
+    archive_id = AutoField(primary_key = True, verbose_name = 'Archive Id')
+    reservation_id = IntegerField(null = False, verbose_name = 'Reservation Id')
+    name = CharField(null = False, verbose_name='Name')
+    gender = CharField(null = False, verbose_name='Gender')
+    passport_number = CharField(null = False, verbose_name = 'Passport #')
     destination = CharField(null = False, verbose_name='Destination')
-    departure_dt = DateTimeField(null = False, verbose_name = 'Departure Date/Time')
-    arrival_dt = DateTimeField(null = False, verbose_name = 'Arrival Date/Time')
+    departure_dt = ReservationDateTimeField(null = False, verbose_name = 'Departure Date/Time')
+    arrival_dt = ReservationDateTimeField(null = False, verbose_name = 'Arrival Date/Time')
+    version = IntegerField(null = False, default = 1, verbose_name = 'Version')
+    archived_dt = DateTimeField(null = False, verbose_name = 'Archived Date/Time')
+
+    class Meta:
+        table_name = 'reservations_archive'
+        indexes = (
+            (('reservation_id',), False),
+            (('passport_number',), False),
+            (('name',), False),
+            (('destination', 'departure_dt'), False),
+            (('arrival_dt',), False),
+        )
+
+
+ARCHIVE_SCHEMA = 'archive'
+ARCHIVE_PATH = None
+
+# Keep the archive in a separate database file (None: the reservations_archive table of the main file).
+# The file is attached to every connection; call create_tables() to create the archive table in it.
+def configureArchive(path=None) -> None:
+    global ARCHIVE_PATH
+    if ARCHIVE_SCHEMA in db._attached:
+        db.detach(ARCHIVE_SCHEMA)
+    ARCHIVE_PATH = path
+    if path != None:
+        db.attach(path, ARCHIVE_SCHEMA)
+    ReservationsArchive._meta.schema = None if path == None else ARCHIVE_SCHEMA
+    return()
+
+
+if os.environ.get('RESERVATIONS_ARCHIVE_DB'):
+    configureArchive(os.environ['RESERVATIONS_ARCHIVE_DB'])
 
 
-class Destinations(BaseModel):
-    destination_id = AutoField(primary_key = True, verbose_name = 'Destination Id')
-    city = CharField(null = False, verbose_name='City')
-    country = CharField(null = True, verbose_name='Country')
-    
-    
 def create_tables():
     db.connect()
-    db.create_tables([Reservations, Destinations])
+    with db.atomic():
+        db.create_tables([Reservations, Destinations, ReservationsArchive])
+        _createReservationsSearch()
+        _createReservationsChanges()
+    db.close()
+
+
+# Adds the change log and its triggers to an existing database
+def create_Reservations_changes():
+    db.connect()
+    with db.atomic():
+        _createReservationsChanges()
+    db.close()
+    print("Created Reservations change log.")
+
+
+# Adds the archive table to an existing database, or to the archive file set with configureArchive()
+def create_Reservations_archive():
+    db.connect()
+    # A new archive file is already initialized in WAL mode when it is attached, so incremental auto_vacuum is
+    # applied with a VACUUM of the (still empty) file
+    if ARCHIVE_PATH != None and db.execute_sql('SELECT count(*) FROM "{}".sqlite_master'.format(ARCHIVE_SCHEMA)).fetchone()[0] == 0:
+        db.execute_sql('PRAGMA "{}".auto_vacuum = INCREMENTAL'.format(ARCHIVE_SCHEMA))
+        db.execute_sql('VACUUM "{}"'.format(ARCHIVE_SCHEMA))
+    db.create_tables([ReservationsArchive])
+    db.close()
+
+
+# Adds the passenger search index to an existing database, or rebuilds it from the reservations table
+def rebuild_Reservations_search():
+    db.connect()
+    with db.atomic():
+        _createReservationsSearch()
+        ReservationsSearch.rebuild()
+    db.execute_sql("INSERT INTO reservations_search(reservations_search) VALUES ('optimize')")
+    db.close()
+    print("Rebuilt Reservations search index.")
+
+
+# Adds the Reservations secondary indexes to an existing database (create_tables() already creates them)
+def create_Reservations_indexes():
+    db.connect()
+    Reservations._schema.create_indexes(safe=True)
+    db.execute_sql("ANALYZE")
+    db.close()
+    print("Created Reservations indexes.")
+
+
+# Adds the Reservations.version column to a database created before it existed. Connecting already does this
+# (see ReservationsDatabase), so it only needs calling to migrate a database without using it.
+def add_Reservations_version_column():
+    db.connect()
+    db.close()
+
+
+
+# Table rebuilds ---------------------------------------------------------------------------------------------------------------------
+# Rebuilds a model's table with the model's current definition, for schema changes Sqlite cannot make in place.
+# expressions: {column: SQL expression over the old table's columns} for new or converted columns; the other columns
+# are copied as they are. The rows are copied into "<table>_migrating" batchSize at a time, one transaction per batch,
+# so readers are not blocked for long. The tables are then swapped in one IMMEDIATE transaction that first copies the
+# rows added since the last batch and re-copies the rows returned by changedKeys() (rows changed during the copy).
+# Columns the old table does not have (e.g. version on a database created before it) are left to their SQL DEFAULT.
+# dateStorage: date storage of the new table (default: the current one). Returns the number of rows in the new table.
+def _rebuildTable(model, expressions: dict, batchSize: int, changedKeys=None, verbose=True, dateStorage=None) -> int:
+    meta = model._meta
+    schema = '' if meta.schema == None else '"{}".'.format(meta.schema)
+    table = meta.table_name
+    key = meta.primary_key.column_name
+    existing = [column.name for column in db.get_columns(table, meta.schema)]
+    columns = []
+    for field in meta.sorted_fields:
+        if field.column_name in expressions or field.column_name in existing:
+            columns.append(field.column_name)
+        elif not field.null and not _hasSqlDefault(field):
+            raise ValueError("Cannot rebuild {}: the table has no {} column and the column has no default".format(table, field.column_name))
+    names = ', '.join('"{}"'.format(column) for column in columns)
+    values = ', '.join(expressions.get(column, '"{}"'.format(column)) for column in columns)
+
+    class Migrating(model):
+        class Meta:
+            table_name = table + '_migrating'
+            indexes = ()
+
+    migrating = Migrating._meta.table_name
+    copyAfter = 'INSERT INTO {0}"{1}" ({2}) SELECT {3} FROM {0}"{4}" WHERE "{5}" > ? ORDER BY "{5}" LIMIT ?'.format( \
+        schema, migrating, names, values, table, key)
+    lastKeySql = 'SELECT coalesce(max("{}"), 0) FROM {}"{}"'.format(key, schema, migrating)
+
+    storage = _dateStorage['mode']
+    _dateStorage['mode'] = getDateStorage() if dateStorage == None else dateStorage # Column types of the new table
+    try:
+        Migrating.drop_table(safe=True) # Left over by an interrupted migration
+        Migrating._schema.create_table(safe=False)
+    finally:
+        _dateStorage['mode'] = storage
+
+    lastKey = 0
+    while True:
+        with db.atomic():
+            count = db.execute_sql(copyAfter, (lastKey, batchSize)).rowcount
+            lastKey = db.execute_sql(lastKeySql).fetchone()[0]
+        if count == 0:
+            break
+        if verbose:
+            print("{}: copied up to {} {}".format(table, key, lastKey), file=sys.stderr)
+
+    with db.atomic('IMMEDIATE'): # Blocks other writers until the new table is in place
+        while db.execute_sql(copyAfter, (lastKey, batchSize)).rowcount > 0:
+            lastKey = db.execute_sql(lastKeySql).fetchone()[0]
+        keys = changedKeys() if changedKeys != None else []
+        for n in range(0, len(keys), IDS_PER_STATEMENT):
+            chunk = keys[n:n + IDS_PER_STATEMENT]
+            marks = ', '.join('?' * len(chunk))
+            db.execute_sql('DELETE FROM {}"{}" WHERE "{}" IN ({})'.format(schema, migrating, key, marks), chunk)
+            db.execute_sql('INSERT INTO {0}"{1}" ({2}) SELECT {3} FROM {0}"{4}" WHERE "{5}" IN ({6})'.format( \
+                schema, migrating, names, values, table, key, marks), chunk)
+        db.execute_sql('DROP TABLE {}"{}"'.format(schema, table)) # Also drops its indexes and triggers
+        db.execute_sql('ALTER TABLE {}"{}" RENAME TO "{}"'.format(schema, migrating, table))
+        model._schema.create_indexes()
+        if model is Reservations:
+            if ReservationsSearch.table_exists():
+                for trigger in _SEARCH_TRIGGERS:
+                    db.execute_sql(trigger)
+            if ReservationsChanges.table_exists():
+                for trigger in _CHANGE_TRIGGERS:
+                    db.execute_sql(trigger)
+        rows = db.execute_sql('SELECT count(*) FROM {}"{}"'.format(schema, table)).fetchone()[0]
+    _reservationsChanged()
+    return(rows)
+
+
+def _hasSqlDefault(field) -> bool:
+    return(any(isinstance(constraint, SQL) and constraint.sql.upper().startswith('DEFAULT') for constraint in field.constraints or []))
+
+
+# changedKeys() for _rebuildTable(Reservations): reservations changed after the current end of the change log
+def _reservationsChangedKeys():
+    if not ReservationsChanges.table_exists():
+        return(None)
+    start = getLastChangeId()
+    return(lambda: [row[0] for row in ReservationsChanges.select(fn.DISTINCT(ReservationsChanges.reservation_id)) \
+        .where(ReservationsChanges.change_id > start).tuples()])
+# End of table rebuilds --------------------------------------------------------------------------------------------------------------
+
+
+# Date storage migration -------------------------------------------------------------------------------------------------------------
+_DATE_COLUMNS = ('departure_dt', 'arrival_dt')
+_DATE_CONVERSIONS = {
+    'epoch': "CAST(strftime('%s', \"{}\") AS INTEGER)", # Sqlite reads the text as UTC, i.e. the wall-clock time unchanged
+    'text': "datetime(\"{}\", 'unixepoch')",
+}
+
+
+def _tableDateStorage(model) -> str:
+    return(_readDateStorage(db.connection(), model._meta.table_name, model._meta.schema or 'main'))
+
+
+# Converts the departure_dt and arrival_dt columns of Reservations and ReservationsArchive to the target storage
+# ('epoch' or 'text'), see "Date storage" above. Rows are copied in batches, readers only wait for the final swap
+# of each table. Reservations changed by other clerks during the copy are re-copied from the change log, but their
+# GUIs keep the storage they read when they connected: restart them afterwards (or migrate with them closed).
+# A database that still stores the destination city must be converted with migrateReservationsDestinations() first.
+# Returns {table name: rows converted}; tables already in the target storage are skipped.
+def migrateDateStorage(target='epoch', batchSize=10000, verbose=True) -> dict:
+    _checkDateStorage(target)
+    report = {}
+    db.connect(reuse_if_open=True)
+    if Reservations.table_exists() and 'destination' in [column.name for column in db.get_columns(Reservations._meta.table_name)]:
+        db.close()
+        raise ValueError("Reservations still stores the destination city: run migrate-destinations before migrate-dates")
+    # The archive first: the swap of the live table switches this process to the new storage
+    for model in (ReservationsArchive, Reservations):
+        if not model.table_exists() or _tableDateStorage(model) == target:
+            continue
+        changedKeys = _reservationsChangedKeys() if model is Reservations else None
+        expressions = {column: _DATE_CONVERSIONS[target].format(column) for column in _DATE_COLUMNS}
+        startTime = time.perf_counter()
+        report[model._meta.table_name] = _rebuildTable(model, expressions, batchSize, changedKeys, verbose, target)
+        if verbose:
+            print("{}: {} rows converted to {} dates in {:.2f}s".format(model._meta.table_name, report[model._meta.table_name], \
+                target, time.perf_counter() - startTime), file=sys.stderr)
+    if len(report) > 0:
+        _dateStorage['mode'] = _readDateStorage(db.connection()) or _dateStorage['default']
+        db.execute_sql('PRAGMA analysis_limit = 1000')
+        db.execute_sql('ANALYZE')
     db.close()
+    return(report)
+# End of date storage migration ------------------------------------------------------------------------------------------------------
+
+
+# Destination migration --------------------------------------------------------------------------------------------------------------
+# Converts a database whose Reservations.destination column holds the city to the destination_id foreign key.
+# The cities in Destinations are trimmed, de-duplicated and made unique, cities only found in reservations are
+# added to Destinations and the archived cities are trimmed too. The Reservations table is then rebuilt in batches
+# (see _rebuildTable()) with each city replaced by its destination_id.
+# Returns the number of reservations converted, 0 when there is nothing to convert.
+def migrateReservationsDestinations(batchSize=10000, verbose=True) -> int:
+    db.connect(reuse_if_open=True)
+    columns = [column.name for column in db.get_columns(Reservations._meta.table_name)]
+    if 'destination' not in columns:
+        db.close()
+        return(0)
+    with db.atomic():
+        db.execute_sql('UPDATE destinations SET city = trim(city) WHERE city != trim(city)')
+        db.execute_sql('DELETE FROM destinations WHERE destination_id NOT IN (SELECT min(destination_id) FROM destinations GROUP BY city)')
+        db.execute_sql('INSERT INTO destinations (city) SELECT DISTINCT trim(destination) FROM reservations '
+            'WHERE trim(destination) NOT IN (SELECT city FROM destinations)')
+        Destinations._schema.create_indexes(safe=True) # Unique city
+    if ReservationsArchive.table_exists(): # The archive keeps the city, trimmed the same way
+        ReservationsArchive.update(destination=fn.trim(ReservationsArchive.destination)) \
+            .where(ReservationsArchive.destination != fn.trim(ReservationsArchive.destination)).execute()
+    _destinationsChanged()
+    expressions = {'destination_id': '(SELECT destination_id FROM destinations WHERE city = trim("reservations"."destination"))'}
+    startTime = time.perf_counter()
+    rows = _rebuildTable(Reservations, expressions, batchSize, _reservationsChangedKeys(), verbose)
+    if verbose:
+        print("reservations: {} rows converted to destination_id in {:.2f}s".format(rows, time.perf_counter() - startTime), file=sys.stderr)
+    db.execute_sql('PRAGMA analysis_limit = 1000')
+    db.execute_sql('ANALYZE')
+    db.close()
+    return(rows)
+# End of destination migration -------------------------------------------------------------------------------------------------------
     
     
+# Bumped whenever this module writes to the Reservations table; lets the controller's query cache detect this
+# process's writes (see getDataStamp())
+reservationsVersion = 0
+
+def _reservationsChanged() -> None:
+    global reservationsVersion
+    reservationsVersion += 1
+
+
+# Bumped whenever this module changes the Destinations table; lets the controller's destinations cache detect changes
+destinationsVersion = 0
+
+def _destinationsChanged() -> None:
+    global destinationsVersion
+    destinationsVersion += 1
+
+
 def drop_Destinations_table():
     db.connect()
     db.drop_tables([Destinations])
     db.close()
+    _destinationsChanged()
     print("Dropped Destinations table.")
     
 
@@ -44,22 +592,26 @@ def create_Destinations_table():
     db.connect()
     db.create_tables([Destinations])
     db.close()
+    _destinationsChanged()
     print("Created Destinations table.")
     
     
 def addDestinationsRecords():
-	cities = ['Havana','Moscow','Beijing', 'London', 'Tokyo', 'Paris', 'Tehran', 'Damascus', '\
-     Sanaa', 'Tripoli', 'Jerusalem']
+	cities = ['Havana','Moscow','Beijing', 'London', 'Tokyo', 'Paris', 'Tehran', 'Damascus', \
+     'Sanaa', 'Tripoli', 'Jerusalem']
 	for item in cities:
 		Destinations.create(city=item)
 	db.commit
+	_destinationsChanged()
 	print("Added Destinations records.")
  
 
 def drop_tables():
     db.connect()
-    db.drop_tables([Reservations, Destinations])
+    db.drop_tables([ReservationsSearch, ReservationsChanges, Reservations, Destinations])
     db.close()
+    _reservationsChanged()
+    _destinationsChanged()
     
 
 def list_tables():
@@ -71,11 +623,12 @@ def list_tables():
 # Creates sqlite db tables corresponding to peewee model classes
 def createReservationsTables():
 	
-	db = SqliteDatabase("reservations.db")
+	# Uses the module level db so the tables are created with the same path and profile as the GUI
 	db.connect()
 
 	tables = ''
 	tables = db.get_tables()
+	db.close()
 
 	list_tables()
 
@@ -89,7 +642,6 @@ def createReservationsTables():
 			print('Dropping reservations tables')
 			drop_tables()
 		else:
-			db.close()
 			exit()
 
 	print("Creating reservations db tables")
@@ -99,19 +651,339 @@ def createReservationsTables():
 	print("Created the following tables:")
 	print()
 	list_tables()
-
-	db.close()
 # Endo of ORM Classes and methods to manage corresponding Sqlite tables -------------------------------------------------------------- 
 
 
+# Optional in-memory read snapshot -----------------------------------------------------------------------------------------------------
+# A copy of the database file in an in-memory Sqlite database, made with the backup API. While it is enabled the
+# list, page, count, search and destinations reads below run on the copy; writes and single-row reads (getReservation())
+# still go to the file. The copy is refreshed on the first read after the file changed, read through a connection of
+# its own that never writes: its PRAGMA data_version changes on every commit by any other connection, this process's
+# peewee connections (one per thread) as well as other clerks. The copy therefore holds committed data only.
+_snapshot = {'database': None, 'watch': None, 'watchPath': None, 'version': None, 'refreshes': 0, 'refresh_ms': 0.0, \
+    'reads': 0}
+_snapshotLock = threading.Lock()
+
+
+def enableReadSnapshot() -> None:
+    with _snapshotLock:
+        if _snapshot['database'] == None:
+            # One connection shared by every thread, an in-memory database only exists for its connection
+            _snapshot['database'] = SqliteDatabase(':memory:', thread_safe=False, check_same_thread=False)
+            _snapshot['version'] = None
+    return()
+
+
+def disableReadSnapshot() -> None:
+    with _snapshotLock:
+        if _snapshot['database'] != None:
+            _snapshot['database'].close()
+            _snapshot['database'] = None
+        _closeSnapshotWatch()
+    return()
+
+
+def _closeSnapshotWatch() -> None:
+    if _snapshot['watch'] != None:
+        _snapshot['watch'].close()
+        _snapshot['watch'] = None
+    _snapshot['version'] = None
+    return()
+
+
+# The snapshot's own read-only connection to the database file (it never takes a write lock or creates the file),
+# reopened when configureDatabase() moved to another file
+def _snapshotWatch():
+    if _snapshot['watch'] == None or _snapshot['watchPath'] != db.database:
+        _closeSnapshotWatch()
+        _snapshot['watch'] = sqlite3.connect('{}?mode=ro'.format(pathlib.Path(db.database).resolve().as_uri()), uri=True, \
+            timeout=db._timeout, check_same_thread=False, isolation_level=None)
+        _snapshot['watchPath'] = db.database
+    return(_snapshot['watch'])
+
+
+def isReadSnapshotEnabled() -> bool:
+    return(_snapshot['database'] != None)
+
+
+# Copies the file into the snapshot if it changed since the last copy (or always with force).
+# Returns True when the snapshot was refreshed.
+def refreshReadSnapshot(force=False) -> bool:
+    with _snapshotLock:
+        if _snapshot['database'] == None:
+            return(False)
+        conn = _snapshotWatch()
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if version == _snapshot['version'] and not force:
+            return(False)
+        start = time.perf_counter()
+        conn.backup(_snapshot['database'].connection())
+        _snapshot['refresh_ms'] += (time.perf_counter() - start) * 1000
+        _snapshot['refreshes'] += 1
+        _snapshot['version'] = version
+    return(True)
+
+
+def getReadSnapshotStats() -> dict:
+    stats = {'enabled': isReadSnapshotEnabled(), 'reads': _snapshot['reads'], 'refreshes': _snapshot['refreshes'], \
+        'refresh_ms': round(_snapshot['refresh_ms'], 3)}
+    return(stats)
+
+
+# Binds a read query to the snapshot when it is enabled, refreshing the snapshot first if the file changed
+def _read(query):
+    if _snapshot['database'] == None:
+        return(query)
+    refreshReadSnapshot()
+    _snapshot['reads'] += 1
+    return(query.bind(_snapshot['database']))
+# End of optional in-memory read snapshot ----------------------------------------------------------------------------------------------
+
+
 # CRUD methods -----------------------------------------------------------------------------------------------------------------------
 def getReservationsData() -> dict:
-	tableData = Reservations.select().order_by(Reservations.reservation_id.desc()).dicts()
+	tableData = _read(Reservations.select().order_by(Reservations.reservation_id.desc()).dicts())
 	return(tableData)
 
 
+# Destinations.city -> destination_id, for converting a batch of rows
+def _destinationIds() -> dict:
+    return({city: destinationId for destinationId, city in Destinations.select(Destinations.destination_id, Destinations.city).tuples()})
+
+
+# destination_id -> city for sort keys, reloaded when this module changes Destinations or an id is not known yet
+_destinationCities = {'version': None, 'cities': {}}
+
+def _destinationCityOf(destinationId) -> str:
+    if _destinationCities['version'] != destinationsVersion or destinationId not in _destinationCities['cities']:
+        _destinationCities['cities'] = {destinationId: city for city, destinationId in _destinationIds().items()}
+        _destinationCities['version'] = destinationsVersion
+    return(_destinationCities['cities'].get(destinationId, destinationId)) # Archive rows already carry the city
+
+
+# Value to store in Reservations.destination for a city (or a destination_id): the id from ids when given, otherwise
+# a subquery, so an unknown city fails the NOT NULL constraint instead of creating a stray destination
+def _destinationValue(destination, ids=None):
+    if isinstance(destination, int):
+        return(destination)
+    if ids != None and destination in ids:
+        return(ids[destination])
+    return(Destinations.select(Destinations.destination_id).where(Destinations.city == destination))
+
+
+# The city of a reservation as a select column, for copying reservations into the archive
+def _destinationCity(model=None):
+    model = Reservations if model == None else model
+    return(Destinations.select(Destinations.city).where(Destinations.destination_id == model.destination).alias('destination'))
+
+
+# Builds the WHERE clause for a filters dict, every condition can be answered from an index:
+#   passportNumber: exact match
+#   namePrefix: names starting with the prefix (case-sensitive range scan on the name index)
+#   destination: exact match on the city (Reservations compares the city's destination_id)
+#   dateFrom / dateTo: departure_dt >= dateFrom and arrival_dt <= dateTo ("%Y-%m-%d %H:%M:%S" strings or datetimes,
+#   converted to the date storage by ReservationDateTimeField)
+def _reservationsFilter(query, filters=None, model=None):
+    model = Reservations if model == None else model # Or ReservationsArchive, which has the same columns
+    if filters == None:
+        return(query)
+    if filters.get('passportNumber'):
+        query = query.where(model.passport_number == filters['passportNumber'])
+    if filters.get('namePrefix'):
+        prefix = filters['namePrefix']
+        query = query.where((model.name >= prefix) & (model.name < prefix + '\U0010ffff'))
+    if filters.get('destination'):
+        if model is Reservations:
+            query = query.where(model.destination == _destinationValue(filters['destination']))
+        else: # The archive keeps the city
+            query = query.where(model.destination == filters['destination'])
+    if filters.get('dateFrom'):
+        query = query.where(model.departure_dt >= filters['dateFrom'])
+    if filters.get('dateTo'):
+        query = query.where(model.arrival_dt <= filters['dateTo'])
+    return(query)
+
+
+# Select list for the row-tuple read path: the same column order as retrieveColumnNames().
+# Dates are returned as stored ("%Y-%m-%d %H:%M:%S" text or epoch seconds) instead of being parsed into datetimes for every row.
+# Reservations rows carry the destination_id, archive rows the city.
+def _reservationsRowColumns(model=None) -> list:
+    model = Reservations if model == None else model
+    columns = [
+        model.reservation_id,
+        model.name,
+        model.gender,
+        model.passport_number,
+        model.destination,
+        model.departure_dt.coerce(False),
+        model.arrival_dt.coerce(False),
+        model.version # Not one of the displayed columns, always the last value
+    ]
+    return(columns)
+
+
+# Sort orders: sort column -> leading ORDER BY fields, reservation_id is always the last (tie-breaking) field.
+# Each order matches a Reservations index (Sqlite appends the rowid, i.e. reservation_id, to every index), so
+# sorted pages are read in index order without a sort step. destination sorts by the city: the query joins
+# Destinations, which Sqlite reads in city order (unique city index) with each city's reservations read from the
+# (destination, departure_dt) index, so rows come out ordered by city, then departure_dt, without a sort step either.
+SORT_COLUMNS = {
+    'reservation_id': (),
+    'name': (Reservations.name,),
+    'passport_number': (Reservations.passport_number,),
+    'destination': (Destinations.city, Reservations.departure_dt),
+    'departure_dt': (Reservations.departure_dt,),
+    'arrival_dt': (Reservations.arrival_dt,),
+}
+DEFAULT_SORT = ('reservation_id', True) # (sort column, descending): newest first
+
+# Position of each field in the row tuples returned by _reservationsRowColumns()
+_ROW_FIELDS = ['reservation_id', 'name', 'gender', 'passport_number', 'destination', 'departure_dt', 'arrival_dt', 'version']
+
+
+def _sortFields(sort) -> tuple:
+    column, descending = DEFAULT_SORT if sort == None else sort
+    if column not in SORT_COLUMNS:
+        raise ValueError("Cannot sort reservations by {}".format(column))
+    return(SORT_COLUMNS[column] + (Reservations.reservation_id,), descending)
+
+
+def _sortOrder(fields: tuple, descending: bool) -> list:
+    return([field.desc() if descending else field.asc() for field in fields])
+
+
+# Joins Destinations when the sort order includes the city
+def _sortJoin(query, fields: tuple):
+    if Destinations.city in fields:
+        query = query.join(Destinations, on=(Reservations.destination == Destinations.destination_id))
+    return(query)
+
+
+# Keyset position of a row tuple in a sort order: the values of its ORDER BY fields (the city for the destination_id)
+def reservationSortKey(row: tuple, sort=None) -> tuple:
+    fields, descending = _sortFields(sort)
+    return(tuple(_destinationCityOf(row[4]) if field is Destinations.city else row[_ROW_FIELDS.index(field.name)] for field in fields))
+
+
+# Streams every reservation (newest first, or in sort order) as a row tuple, without caching rows in the query
+def getReservationsRows(filters=None, sort=None):
+    fields, descending = _sortFields(sort)
+    query = _reservationsFilter(_sortJoin(Reservations.select(*_reservationsRowColumns()), fields), filters)
+    return(_read(query.order_by(*_sortOrder(fields, descending))).tuples().iterator())
+
+
+# Filtered search with LIMIT/OFFSET pushed down to Sqlite, newest first (or in sort order); returns row tuples
+def findReservations(filters=None, limit=20, offset=0, sort=None) -> list:
+    fields, descending = _sortFields(sort)
+    query = _reservationsFilter(_sortJoin(Reservations.select(*_reservationsRowColumns()), fields), filters)
+    tableData = list(_read(query.order_by(*_sortOrder(fields, descending)).limit(limit).offset(offset).tuples()))
+    return(tableData)
+
+
+# Keyset pagination in any SORT_COLUMNS order.
+# sort: (sort column, descending), default DEFAULT_SORT
+# key: sort key (see reservationSortKey()) of the row the page starts after; None for the first page
+# previous: return the page of rows before key instead (previous page)
+# inclusive: the page starts at key rather than after it (reloading the current page)
+# filters: optional filters dict, see _reservationsFilter()
+# The key is compared as a row value, (name, reservation_id) < (?, ?), which Sqlite answers with a range scan
+# of the sort order's index, so only pageSize rows are read regardless of the table size. Returns row tuples.
+def getReservationsSortedPage(pageSize=20, sort=None, key=None, previous=False, inclusive=False, filters=None) -> list:
+    fields, descending = _sortFields(sort)
+    query = _reservationsFilter(_sortJoin(Reservations.select(*_reservationsRowColumns()), fields), filters)
+    forward = descending != previous # Direction of the index scan
+    if key != None:
+        rowValue = Tuple(*fields)
+        bound = Tuple(*key)
+        if forward:
+            query = query.where(rowValue <= bound if inclusive else rowValue < bound)
+        else:
+            query = query.where(rowValue >= bound if inclusive else rowValue > bound)
+    tableData = list(_read(query.order_by(*_sortOrder(fields, forward)).limit(pageSize).tuples()))
+    if previous:
+        tableData.reverse()
+    return(tableData)
+
+
+# Keyset pagination on reservation_id (newest first, same order as getReservationsData()).
+# beforeId: return the page of rows older than beforeId (next page)
+# afterId: return the page of rows newer than afterId (previous page)
+# filters: optional filters dict, see _reservationsFilter()
+# Only pageSize rows are read regardless of the table size. Returns row tuples.
+def getReservationsPage(pageSize=20, beforeId=None, afterId=None, filters=None) -> list:
+    if afterId != None:
+        return(getReservationsSortedPage(pageSize, key=(afterId,), previous=True, filters=filters))
+    key = None if beforeId == None else (beforeId,)
+    return(getReservationsSortedPage(pageSize, key=key, filters=filters))
+
+
+# Returns the sort key of the row found at position offset in the sort order, used to jump to a page.
+# Only the sort order's index is read (it holds every ORDER BY field), not the table rows.
+def getReservationKeyAtOffset(offset, filters=None, sort=None) -> tuple:
+    fields, descending = _sortFields(sort)
+    query = (_reservationsFilter(_sortJoin(Reservations.select(*[field.coerce(False) for field in fields]), fields), filters)
+        .order_by(*_sortOrder(fields, descending))
+        .offset(offset).limit(1).tuples())
+    rows = list(_read(query))
+    return(rows[0] if len(rows) > 0 else None)
+
+
+# Returns the reservation_id found at position offset (newest first), used to jump to a page.
+def getReservationIdAtOffset(offset, filters=None) -> int:
+    key = getReservationKeyAtOffset(offset, filters)
+    return(None if key == None else key[0])
+
+
+# Sortable tree columns: verbose name -> sort column
+def retrieveSortColumns() -> dict:
+    return({getattr(Reservations, name).verbose_name: name for name in SORT_COLUMNS})
+
+
+def getReservationsCount(filters=None) -> int:
+    return(_read(_reservationsFilter(Reservations.select(), filters)).count())
+
+
+# Single reservation as a row tuple
+def getReservation(idval) -> tuple:
+    record = Reservations.select(*_reservationsRowColumns()).where(Reservations.reservation_id == idval).tuples().get()
+    return(record)
+
+
+# Passenger search -------------------------------------------------------------------------------------------------------------------
+SEARCH_MIN_FRAGMENT = 3 # Shortest fragment the trigram index can match
+
+# FTS5 query for the search text: every word of 3 or more characters must appear somewhere in the name or
+# passport number. Words are quoted so FTS5 operators and punctuation in the text are matched literally.
+def _searchMatchExpression(text: str) -> str:
+    fragments = [word for word in text.split() if len(word) >= SEARCH_MIN_FRAGMENT]
+    return(" ".join('"{}"'.format(word.replace('"', '""')) for word in fragments))
+
+
+# Passenger search on fragments of names and passport numbers through the ReservationsSearch index, best
+# matches (bm25) first. Text shorter than SEARCH_MIN_FRAGMENT falls back to a name or passport number prefix
+# match on their indexes. filters: optional filters dict, see _reservationsFilter(). Returns row tuples.
+def searchReservationsText(text: str, limit=50, filters=None) -> list:
+    text = text.strip()
+    if len(text) == 0:
+        return([])
+    query = _reservationsFilter(Reservations.select(*_reservationsRowColumns()), filters)
+    match = _searchMatchExpression(text)
+    if len(match) == 0:
+        upper = text + '\U0010ffff'
+        query = query.where(((Reservations.name >= text) & (Reservations.name < upper)) | \
+            ((Reservations.passport_number >= text) & (Reservations.passport_number < upper)))
+        query = query.order_by(Reservations.reservation_id.desc())
+    else:
+        query = query.join(ReservationsSearch, on=(ReservationsSearch.rowid == Reservations.reservation_id)) \
+            .where(ReservationsSearch.match(match)) \
+            .order_by(ReservationsSearch.bm25(), Reservations.reservation_id.desc())
+    tableData = list(_read(query.limit(limit).tuples()))
+    return(tableData)
+# End of passenger search ------------------------------------------------------------------------------------------------------------
+
+
 def getDestinationsData() -> dict:
-    tableData = Destinations.select(Destinations.city).order_by(Destinations.city.asc()).dicts()
+    tableData = _read(Destinations.select(Destinations.destination_id, Destinations.city).order_by(Destinations.city.asc()).dicts())
     return(tableData)
 	
 	
@@ -128,35 +1000,233 @@ def retrieveColumnNames() -> list:
 	return(fieldNames)
 
 	
-def deleteReservation(idval) -> None:
-	record = Reservations.get(Reservations.reservation_id == idval)
-	record.delete_instance()
-	db.commit
+# Single DELETE statement; when version is given the row is only deleted if nobody changed it since it was read.
+# Returns the number of rows deleted (0 if the row is gone or its version changed).
+def deleteReservation(idval, version=None) -> int:
+    query = Reservations.delete().where(Reservations.reservation_id == idval)
+    if version != None:
+        query = query.where(Reservations.version == version)
+    count = query.execute()
+    _reservationsChanged()
+    return(count)
 	
  
 def createReservation(name, gender, passport_num, destination, departure_dt, arrival_dt) -> None:
-	Reservations.create(name=name, gender=gender, passport_number=passport_num, destination=destination, departure_dt=departure_dt, \
-     arrival_dt=arrival_dt)
+	Reservations.create(name=name, gender=gender, passport_number=passport_num, destination=_destinationValue(destination), \
+     departure_dt=departure_dt, arrival_dt=arrival_dt)
 	db.commit
+	_reservationsChanged()
+ 
+ 
+# Inserts a batch of reservations (list of dicts keyed by Reservations field names) in one transaction.
+# Rows are sent as multi-row INSERT statements of INSERT_ROWS_PER_STATEMENT rows to stay under
+# Sqlite's bound-parameter limit. Cities are converted to destination_ids with one Destinations read per batch.
+INSERT_ROWS_PER_STATEMENT = 100
+
+def createReservationsBatch(rows: list) -> int:
+    with db.atomic():
+        ids = _destinationIds()
+        for batch in chunked(rows, INSERT_ROWS_PER_STATEMENT):
+            Reservations.insert_many([dict(row, destination=_destinationValue(row['destination'], ids)) for row in batch]).execute()
+    _reservationsChanged()
+    return(len(rows))
  
  
-def updateReservation(idVal, name, gender, passport_num, destination, departure_dt, arrival_dt) -> None:
-    record = Reservations.select().where(Reservations.reservation_id == idVal).get()
-    record.name = name
-    record.gender = gender
-    record.passport_number = passport_num
-    record.destination = destination
-    record.departure_dt = departure_dt
-    record.arrival_dt = arrival_dt
-    record.save()
-    db.commit
+# Single UPDATE statement that also increments the row version; when version is given the row is only updated
+# if nobody changed it since it was read. Returns the number of rows updated (0 on a conflict).
+def updateReservation(idVal, name, gender, passport_num, destination, departure_dt, arrival_dt, version=None) -> int:
+    query = Reservations.update(name=name, gender=gender, passport_number=passport_num, destination=_destinationValue(destination), \
+        departure_dt=departure_dt, arrival_dt=arrival_dt, version=Reservations.version + 1) \
+        .where(Reservations.reservation_id == idVal)
+    if version != None:
+        query = query.where(Reservations.version == version)
+    count = query.execute()
+    _reservationsChanged()
+    return(count)
+    
+# Bulk operations on a list of reservation_ids, each run in one transaction. Ids are sent in
+# IN (...) lists of IDS_PER_STATEMENT to stay under Sqlite's bound-parameter limit.
+IDS_PER_STATEMENT = 500
+
+def deleteReservationsBatch(ids: list) -> int:
+    count = 0
+    with db.atomic():
+        for batch in chunked(ids, IDS_PER_STATEMENT):
+            count += Reservations.delete().where(Reservations.reservation_id.in_(batch)).execute()
+    _reservationsChanged()
+    return(count)
+
+
+# fields: Reservations field names and their new values, e.g. {'destination': 'Tokyo'}
+def updateReservationsBatch(ids: list, fields: dict) -> int:
+    count = 0
+    values = dict(fields)
+    values['version'] = Reservations.version + 1
+    if 'destination' in values:
+        values['destination'] = _destinationValue(values['destination'])
+    with db.atomic():
+        for batch in chunked(ids, IDS_PER_STATEMENT):
+            count += Reservations.update(values).where(Reservations.reservation_id.in_(batch)).execute()
+    _reservationsChanged()
+    return(count)
     
 # End of CRUD methods -----------------------------------------------------------------------------------------------------------------------
 
 
+# Change detection methods -------------------------------------------------------------------------------------------------------------
+# PRAGMA data_version of this thread's connection: changes whenever another connection (in this or another process)
+# commits, so it is a cheap "anything new?" check before reading the change log
+def getDataVersion() -> int:
+    return(db.execute_sql('PRAGMA data_version').fetchone()[0])
+
+
+# Version of the data as seen from this thread: changes with every write made through this module (reservationsVersion,
+# destinationsVersion) and every commit by another connection (PRAGMA data_version, which only compares within one
+# connection, hence the connection's identity). Used by the controller's query cache.
+def getDataStamp() -> tuple:
+    conn = db.connection()
+    return((reservationsVersion, destinationsVersion, id(conn), conn.execute('PRAGMA data_version').fetchone()[0]))
+
+
+def hasReservationsChanges() -> bool:
+    return(ReservationsChanges._meta.table_name in db.get_tables())
+
+
+def getLastChangeId() -> int:
+    return(ReservationsChanges.select(fn.MAX(ReservationsChanges.change_id)).scalar() or 0)
+
+
+def getFirstChangeId() -> int:
+    return(ReservationsChanges.select(fn.MIN(ReservationsChanges.change_id)).scalar())
+
+
+# Change log entries after changeId as (change_id, reservation_id, action) tuples, oldest first
+def getReservationsChangesSince(changeId: int, limit=1000) -> list:
+    query = (ReservationsChanges.select(ReservationsChanges.change_id, ReservationsChanges.reservation_id, ReservationsChanges.action)
+        .where(ReservationsChanges.change_id > changeId)
+        .order_by(ReservationsChanges.change_id)
+        .limit(limit))
+    return(list(query.tuples()))
+
+
+# Deletes change log entries older than maxAgeSeconds; returns the number deleted. Running change notifiers prune as
+# they go; compactDatabase() and "python reservationsModel.py prune-changes" keep the log bounded on hosts without a GUI.
+def pruneReservationsChanges(maxAgeSeconds=CHANGES_RETENTION) -> int:
+    cutoff = SQL("datetime('now', ?)", ['-{:d} seconds'.format(int(maxAgeSeconds))])
+    return(ReservationsChanges.delete().where(ReservationsChanges.changed_dt < cutoff).execute())
+# End of change detection methods ------------------------------------------------------------------------------------------------------
+
+
+# Archive methods ----------------------------------------------------------------------------------------------------------------------
+# Moves up to batchSize reservations whose arrival_dt is before cutoff ("%Y-%m-%d %H:%M:%S" or a datetime) into
+# ReservationsArchive, in one transaction: an INSERT ... SELECT of the batch followed by a DELETE of the same
+# rows (the passenger search index is updated by its delete trigger).
+# Returns the number of reservations moved, 0 when there is nothing left to archive.
+def archiveReservationsBatch(cutoff: str, batchSize=1000) -> int:
+    archivedDt = datetime.now().strftime(DATE_FORMAT)
+    batch = (Reservations.select(Reservations.reservation_id)
+        .where(Reservations.arrival_dt < cutoff)
+        .order_by(Reservations.reservation_id)
+        .limit(batchSize))
+    columns = _reservationsRowColumns()
+    columns[4] = _destinationCity() # The archive keeps the city: it may be a separate file without Destinations
+    source = Reservations.select(*columns, Value(archivedDt)).where(Reservations.reservation_id.in_(batch))
+    with db.atomic():
+        ReservationsArchive.insert_from(source, _reservationsRowColumns(ReservationsArchive)[:len(columns)] + \
+            [ReservationsArchive.archived_dt]).execute()
+        count = Reservations.delete().where(Reservations.reservation_id.in_(batch)).execute()
+    _reservationsChanged()
+    return(count)
+
+
+# On-demand reads of archived reservations, as row tuples in the same column order as the live rows.
+# filters: optional filters dict, see _reservationsFilter(). Most recently archived first.
+def findArchivedReservations(filters=None, limit=20, offset=0) -> list:
+    query = _reservationsFilter(ReservationsArchive.select(*_reservationsRowColumns(ReservationsArchive)), filters, ReservationsArchive)
+    tableData = list(query.order_by(ReservationsArchive.archive_id.desc()).limit(limit).offset(offset).tuples())
+    return(tableData)
+
+
+def getArchivedReservationsRows(filters=None):
+    query = _reservationsFilter(ReservationsArchive.select(*_reservationsRowColumns(ReservationsArchive)), filters, ReservationsArchive)
+    return(query.order_by(ReservationsArchive.archive_id.desc()).tuples().iterator())
+
+
+def getArchivedReservationsCount(filters=None) -> int:
+    return(_reservationsFilter(ReservationsArchive.select(), filters, ReservationsArchive).count())
+
+
+def _schemaPragma(schema: str, pragma: str):
+    return(db.execute_sql('PRAGMA "{}".{}'.format(schema, pragma)).fetchone())
+
+
+# Returns the space freed by deleted rows to the file system and refreshes the query planner statistics.
+# Runs on the main database and, when attached, the archive file.
+# pages: free pages to release per database with PRAGMA incremental_vacuum (None: all of them)
+# full: VACUUM instead, which also converts a database created without incremental auto_vacuum (slow, rewrites the file)
+# Change log entries older than CHANGES_RETENTION seconds are pruned first, so their pages are released too.
+# Returns {schema: {'auto_vacuum', 'pages_before', 'free_before', 'pages_after', 'free_after'}}, plus 'changes_pruned' for main
+def compactDatabase(pages=None, full=False, analyze=True) -> dict:
+    schemas = ['main'] + ([ARCHIVE_SCHEMA] if ARCHIVE_PATH != None else [])
+    report = {}
+    db.connect(reuse_if_open=True)
+    pruned = pruneReservationsChanges() if ReservationsChanges.table_exists() else 0
+    for schema in schemas:
+        stats = {'pages_before': _schemaPragma(schema, 'page_count')[0], 'free_before': _schemaPragma(schema, 'freelist_count')[0]}
+        if schema == 'main':
+            stats['changes_pruned'] = pruned
+        if full:
+            _schemaPragma(schema, 'auto_vacuum = INCREMENTAL')
+            db.execute_sql('VACUUM "{}"'.format(schema))
+        elif _schemaPragma(schema, 'auto_vacuum')[0] == 2: # INCREMENTAL
+            db.execute_sql('PRAGMA "{}".incremental_vacuum{}'.format(schema, '' if pages == None else '({:d})'.format(pages))).fetchall()
+        stats['auto_vacuum'] = ('none', 'full', 'incremental')[_schemaPragma(schema, 'auto_vacuum')[0]]
+        if analyze:
+            db.execute_sql('PRAGMA analysis_limit = 1000') # Sampled statistics, ANALYZE stays fast on large tables
+            db.execute_sql('ANALYZE "{}"'.format(schema))
+        stats['pages_after'] = _schemaPragma(schema, 'page_count')[0]
+        stats['free_after'] = _schemaPragma(schema, 'freelist_count')[0]
+        report[schema] = stats
+    db.execute_sql('PRAGMA wal_checkpoint(TRUNCATE)') # Freed pages leave the file once the WAL is checkpointed
+    db.close()
+    return(report)
+# End of archive methods ---------------------------------------------------------------------------------------------------------------
+
+
 # Drop/Create/Load tables
 # Test CRUD methods
+# python reservationsModel.py rebuild-search: adds or rebuilds the passenger search index of RESERVATIONS_DB
+# python reservationsModel.py create-changes: adds the change log (reservations_changes and its triggers) to RESERVATIONS_DB
+# python reservationsModel.py prune-changes [max age seconds]: deletes older change log entries (default CHANGES_RETENTION)
+# python reservationsModel.py migrate-dates epoch|text [batch size]: converts the date storage of RESERVATIONS_DB
+# python reservationsModel.py migrate-destinations [batch size]: converts Reservations.destination to destination_id
 def main():
+    if sys.argv[1:] == ['rebuild-search']:
+        rebuild_Reservations_search()
+        return()
+    if sys.argv[1:] == ['create-changes']:
+        create_Reservations_changes()
+        return()
+    if sys.argv[1:2] == ['prune-changes'] and len(sys.argv) in (2, 3):
+        db.connect()
+        count = pruneReservationsChanges(int(sys.argv[2]) if len(sys.argv) == 3 else CHANGES_RETENTION) if ReservationsChanges.table_exists() else 0
+        db.close()
+        print("Pruned {} change log entries.".format(count))
+        return()
+    if sys.argv[1:2] == ['migrate-destinations'] and len(sys.argv) in (2, 3):
+        rows = migrateReservationsDestinations(int(sys.argv[2]) if len(sys.argv) == 3 else 10000)
+        print("Converted {} reservations to destination_id.".format(rows) if rows > 0 else "Already using destination_id.")
+        return()
+    if sys.argv[1:2] == ['migrate-dates'] and len(sys.argv) in (3, 4):
+        batchSize = int(sys.argv[3]) if len(sys.argv) == 4 else 10000
+        try:
+            report = migrateDateStorage(sys.argv[2], batchSize)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        print("Converted: {}".format(report) if len(report) > 0 else "Already using {} dates.".format(sys.argv[2]))
+        print("Run 'python reservationsArchive.py compact' to release the space of the old tables.")
+        return()
 
 	# drop_Destinations_table()
 	# create_Destinations_table()
@@ -0,0 +1,119 @@
+# Cold start measurement for the reservations app.
+# reservationsView imports this module first and calls mark() as startup progresses:
+#   imports       PySimpleGUI, reservationsController and reservationsModel are loaded
+#   first_paint   the main window is shown
+#   destinations  the Destinations list has arrived from the database
+# Set RESERVATIONS_STARTUP_REPORT=1 to print the phase timings when startup completes, checked against
+# RESERVATIONS_STARTUP_BUDGET_MS (time to first paint, default 1000).
+#
+# Run as a script to get an import time report (python -X importtime) for reservationsView:
+# Usage: python reservationsStartup.py [--budget-ms 400] [--top 15] [--module reservationsView]
+# Exits with status 1 when the total import time is over the budget.
+
+import os
+import sys
+import time
+
+
+DEFAULT_BUDGET_MS = 1000.0
+
+_start = time.perf_counter()
+_marks = [] # (phase, ms since this module was imported)
+_reported = False
+
+
+def mark(phase: str) -> None:
+    _marks.append((phase, (time.perf_counter() - _start) * 1000))
+    return()
+
+
+def getMarks() -> dict:
+    return({phase: round(ms, 1) for phase, ms in _marks})
+
+
+def _budgetMs() -> float:
+    return(float(os.environ.get('RESERVATIONS_STARTUP_BUDGET_MS', DEFAULT_BUDGET_MS)))
+
+
+# Prints the phase timings once, when RESERVATIONS_STARTUP_REPORT is set
+def report(file=sys.stderr) -> None:
+    global _reported
+    if _reported or os.environ.get('RESERVATIONS_STARTUP_REPORT', '') in ('', '0'):
+        return()
+    _reported = True
+    previous = 0.0
+    print("{:<15} {:>10} {:>10}".format('Phase', 'At ms', 'Took ms'), file=file)
+    for phase, ms in _marks:
+        print("{:<15} {:>10.1f} {:>10.1f}".format(phase, ms, ms - previous), file=file)
+        previous = ms
+    firstPaint = getMarks().get('first_paint')
+    if firstPaint != None:
+        budget = _budgetMs()
+        status = 'OK' if firstPaint <= budget else 'OVER BUDGET'
+        print("First paint: {:.1f} ms (budget {:.0f} ms) {}".format(firstPaint, budget, status), file=file)
+    return()
+
+
+# Import time report -------------------------------------------------------------------------------------------------------------
+# Parses "import time: self [us] | cumulative | imported package" lines from python -X importtime.
+# Returns a list of (module, self us, cumulative us, nesting depth) in import order.
+def parseImportTime(text: str) -> list:
+    entries = []
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue # Header line
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2 # One space after '|', then two per level
+        entries.append((name.strip(), int(parts[0]), int(parts[1]), depth))
+    return(entries)
+
+
+def measureImports(module='reservationsView') -> dict:
+    import subprocess
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)], \
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    wallMs = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError("Importing {} failed:\n{}".format(module, proc.stderr))
+    entries = parseImportTime(proc.stderr)
+    # The interpreter's own imports (site, encodings) come first, the module's cumulative time is the total
+    own = [e for e in entries if e[0] == module and e[3] == 0]
+    result = {
+        'module': module,
+        'total_ms': round(own[-1][2] / 1000, 1) if len(own) > 0 else 0.0,
+        'process_ms': round(wallMs, 1),
+        'imports': [{'module': e[0], 'self_ms': round(e[1] / 1000, 1), 'cumulative_ms': round(e[2] / 1000, 1)} for e in entries],
+    }
+    return(result)
+# End of import time report ------------------------------------------------------------------------------------------------------
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Report the import time of the reservations app")
+    parser.add_argument('--module', default='reservationsView', help="Module to import")
+    parser.add_argument('--budget-ms', dest='budgetMs', type=float, default=None, \
+        help="Import time budget (default: RESERVATIONS_STARTUP_BUDGET_MS or {:.0f})".format(DEFAULT_BUDGET_MS))
+    parser.add_argument('--top', type=int, default=15, help="Number of slowest imports to list")
+    args = parser.parse_args()
+
+    result = measureImports(args.module)
+    budget = args.budgetMs if args.budgetMs != None else _budgetMs()
+    ordered = sorted(result['imports'], key=lambda e: e['cumulative_ms'], reverse=True)
+    print("{:<45} {:>10} {:>10}".format('Module', 'Self ms', 'Cumul. ms'))
+    for e in ordered[:args.top]:
+        print("{:<45} {:>10.1f} {:>10.1f}".format(e['module'], e['self_ms'], e['cumulative_ms']))
+    print()
+    print("import {}: {:.1f} ms (process {:.1f} ms), budget {:.0f} ms".format(result['module'], result['total_ms'], \
+        result['process_ms'], budget))
+    if result['total_ms'] > budget:
+        print("OVER BUDGET")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+# Reservation validation rules shared by reservationsView, reservationsImport and any other client.
+# Works on plain record dicts keyed by Reservations field names, parses each field once and returns
+# structured errors: dicts with 'field', 'code' and 'message' keys.
+#
+# Error codes:
+#   missing           the field is empty
+#   invalid           the date/time is not formatted as DATE_FORMAT with zero-padded fields (see DATE_PATTERN)
+#   unknown           gender or destination is not one of the allowed values
+#   before_now        the departure/arrival date/time is not in the future
+#   before_departure  the arrival is not after the departure
+#
+# validateBatch() validates columns of many records at once. It compares the dates as NumPy datetime64
+# arrays against a single "now" when NumPy is installed, and falls back to plain Python otherwise.
+# NumPy is only imported on the first batch, so the GUI does not pay for it at startup.
+
+import re
+from datetime import datetime
+
+np = None
+_numpyChecked = False
+
+
+def _loadNumpy():
+    global np, _numpyChecked
+    if not _numpyChecked:
+        _numpyChecked = True
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            np = None
+    return(np)
+
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# The exact text of DATE_FORMAT: fields zero-padded, as stored, so stored dates sort and filter as text.
+# Checked before strptime and NumPy, which both accept more (unpadded fields, NumPy also time zones and signed years).
+# Year 0000 is excluded because strptime rejects it and NumPy does not.
+DATE_PATTERN = re.compile(r'(?!0000)\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}', re.ASCII)
+GENDERS = ('Male', 'Female')
+
+# Checked in this order, which is also the order of the GUI's "Missing data" message
+FIELD_NAMES = ['name', 'passport_number', 'gender', 'departure_dt', 'arrival_dt', 'destination']
+FIELD_LABELS = {
+    'name': 'Name',
+    'passport_number': 'Passport Number',
+    'gender': 'Gender',
+    'departure_dt': 'Departure Date',
+    'arrival_dt': 'Arrival Date',
+    'destination': 'Destination',
+}
+
+
+def _error(field: str, code: str, message: str) -> dict:
+    return({'field': field, 'code': code, 'message': message})
+
+
+def _missing(field: str) -> dict:
+    return(_error(field, 'missing', "Missing {}".format(FIELD_LABELS[field])))
+
+
+def _invalid(field: str, value: str) -> dict:
+    return(_error(field, 'invalid', "{} is not a valid date/time: {}".format(FIELD_LABELS[field], value)))
+
+
+def _beforeNow(field: str) -> dict:
+    return(_error(field, 'before_now', "{} comes before today's date".format(FIELD_LABELS[field])))
+
+
+def _beforeDeparture() -> dict:
+    return(_error('arrival_dt', 'before_departure', "Arrival Date comes before Departure Date"))
+
+
+def _text(value) -> str:
+    return("" if value == None else str(value).strip())
+
+
+def parseDateTime(text: str) -> datetime:
+    if DATE_PATTERN.fullmatch(text) == None:
+        return(None)
+    try:
+        return(datetime.strptime(text, DATE_FORMAT))
+    except ValueError:
+        return(None)
+
+
+# Checks that do not involve dates; values holds the stripped text of every field
+def _checkFields(values: dict, destinations) -> list:
+    errors = []
+    for field in FIELD_NAMES:
+        if len(values[field]) == 0:
+            errors.append(_missing(field))
+    if len(values['gender']) > 0 and values['gender'] not in GENDERS:
+        errors.append(_error('gender', 'unknown', "Unknown Gender: {}".format(values['gender'])))
+    if destinations != None and len(values['destination']) > 0 and values['destination'] not in destinations:
+        errors.append(_error('destination', 'unknown', "Unknown Destination: {}".format(values['destination'])))
+    return(errors)
+
+
+# Validates one record dict. destinations: optional collection of allowed cities.
+# Returns (row dict of stripped field values, list of errors)
+def validateReservation(record: dict, now=None, destinations=None) -> tuple[dict, list]:
+    now = datetime.now() if now == None else now
+    row = {field: _text(record.get(field)) for field in FIELD_NAMES}
+    errors = _checkFields(row, destinations)
+    errors.extend(validateDates(row['departure_dt'], row['arrival_dt'], now))
+    return(row, errors)
+
+
+# Date checks only, for non-empty departure/arrival strings (empty values are skipped)
+def validateDates(departure_dt: str, arrival_dt: str, now=None) -> list:
+    now = datetime.now() if now == None else now
+    errors = []
+    departure_obj = None
+    arrival_obj = None
+    if len(departure_dt) > 0:
+        departure_obj = parseDateTime(departure_dt)
+        if departure_obj == None:
+            errors.append(_invalid('departure_dt', departure_dt))
+        elif departure_obj <= now:
+            errors.append(_beforeNow('departure_dt'))
+    if len(arrival_dt) > 0:
+        arrival_obj = parseDateTime(arrival_dt)
+        if arrival_obj == None:
+            errors.append(_invalid('arrival_dt', arrival_dt))
+        elif arrival_obj <= now:
+            errors.append(_beforeNow('arrival_dt'))
+    if departure_obj != None and arrival_obj != None and arrival_obj <= departure_obj:
+        errors.append(_beforeDeparture())
+    return(errors)
+
+
+# Batch mode -----------------------------------------------------------------------------------------------------------------------
+# Parses a column of date strings into datetime64[s]; empty values and values parseDateTime() rejects become NaT
+def _parseDateColumn(texts: list):
+    wellFormed = [t if DATE_PATTERN.fullmatch(t) != None else '' for t in texts]
+    try:
+        return(np.array(wellFormed, dtype='datetime64[s]'))
+    except ValueError: # e.g. month 13, parse element by element
+        parsed = []
+        for t in wellFormed:
+            try:
+                parsed.append(np.datetime64(t, 's'))
+            except ValueError:
+                parsed.append(np.datetime64('NaT'))
+        return(np.array(parsed, dtype='datetime64[s]'))
+
+
+def _dateFlagsNumpy(departures: list, arrivals: list, now: datetime) -> tuple:
+    nowValue = np.datetime64(now.replace(microsecond=0), 's')
+    departure = _parseDateColumn(departures)
+    arrival = _parseDateColumn(arrivals)
+    departureOk = ~np.isnat(departure)
+    arrivalOk = ~np.isnat(arrival)
+    flags = (
+        departureOk,
+        arrivalOk,
+        departureOk & (departure <= nowValue),
+        arrivalOk & (arrival <= nowValue),
+        departureOk & arrivalOk & (arrival <= departure),
+    )
+    return(tuple(flag.tolist() for flag in flags))
+
+
+def _dateFlagsPython(departures: list, arrivals: list, now: datetime) -> tuple:
+    departure = [parseDateTime(t) if len(t) > 0 else None for t in departures]
+    arrival = [parseDateTime(t) if len(t) > 0 else None for t in arrivals]
+    departureOk = [d != None for d in departure]
+    arrivalOk = [a != None for a in arrival]
+    flags = (
+        departureOk,
+        arrivalOk,
+        [d != None and d <= now for d in departure],
+        [a != None and a <= now for a in arrival],
+        [d != None and a != None and a <= d for d, a in zip(departure, arrival)],
+    )
+    return(flags)
+
+
+# Validates many records given as columns: {field name: list of values}, all lists the same length.
+# Each date column is parsed once and compared against a single "now".
+# Returns (rows, errors): rows is {field name: list of stripped values}, errors is a list with one
+# list of errors per record (empty for valid records).
+def validateBatch(columns: dict, now=None, destinations=None) -> tuple[dict, list]:
+    now = datetime.now() if now == None else now
+    count = len(next(iter(columns.values()))) if len(columns) > 0 else 0
+    rows = {field: [_text(v) for v in columns.get(field, [None] * count)] for field in FIELD_NAMES}
+    departures = rows['departure_dt']
+    arrivals = rows['arrival_dt']
+
+    if _loadNumpy() != None:
+        departureOk, arrivalOk, departurePast, arrivalPast, arrivalFirst = _dateFlagsNumpy(departures, arrivals, now)
+    else:
+        departureOk, arrivalOk, departurePast, arrivalPast, arrivalFirst = _dateFlagsPython(departures, arrivals, now)
+
+    errors = []
+    for n in range(count):
+        recordErrors = _checkFields({field: rows[field][n] for field in FIELD_NAMES}, destinations)
+        if len(departures[n]) > 0:
+            if not departureOk[n]:
+                recordErrors.append(_invalid('departure_dt', departures[n]))
+            elif departurePast[n]:
+                recordErrors.append(_beforeNow('departure_dt'))
+        if len(arrivals[n]) > 0:
+            if not arrivalOk[n]:
+                recordErrors.append(_invalid('arrival_dt', arrivals[n]))
+            elif arrivalPast[n]:
+                recordErrors.append(_beforeNow('arrival_dt'))
+        if arrivalFirst[n]:
+            recordErrors.append(_beforeDeparture())
+        errors.append(recordErrors)
+
+    return(rows, errors)
+# End of batch mode ----------------------------------------------------------------------------------------------------------------
@@ -3,10 +3,20 @@
 # Validates user input before sending data to the reservationsModel via the reservationsController.
 # Where necessary, the reservationsView passes references to GUI windows so that the reservationsController
 # can update the reservationsView.
+# Windows and popups are created through reservationsViewBackend, which can replace PySimpleGUI with a headless
+# backend that replays scripted events through the run() loops below (for tests and benchmarks without a display).
 
+import os
+import reservationsStartup as rs # First, so the startup report covers the imports below
 import PySimpleGUI as sg
 import reservationsController as rc
-from datetime import datetime
+import reservationsValidation as rv
+import reservationsViewBackend as vb
+rs.mark('imports')
+
+
+# How each kind of date error ends in the error popup (the other invalid values end with "!\n")
+_MESSAGE_ENDINGS = {'before_now': "!!!\n", 'before_departure': "!"}
 
 
 # Window for creating reservations
@@ -16,17 +26,25 @@ class ReservationsSystem:
         self._themeStr = theme
         self._gender = ""
         self._destinations = []
+        self._pending = 0 # Database calls waiting for a result event
         
         # Set GUI theme           
         sg.theme(self._themeStr)
 
-        self._layout = [self._getFormLayout(), self._getButtonLayout()]
+        # The form is shown straight away, destinations are filled in when they arrive as a rc.DB_RESULT_EVENT
+        self._layout = [self._getFormLayout(deferDestinations=True), self._getButtonLayout(), self._getStatusLayout()]
 
-        self._window = sg.Window('Flight Reservations System', self._layout, keep_on_top=True, finalize=False)
+        self._window = vb.window('Flight Reservations System', self._layout, keep_on_top=True, finalize=True)
+        rs.mark('first_paint')
+        rc.submitDBTask(self._window, 'destinations', rc.retrieveDestinations)
+        self._setBusy(1)
 
 
-    def _getFormLayout(self) -> list:
-        self._destinations = rc.retrieveDestinations()# RETRIEVE Destinations for ListBox
+    def _getFormLayout(self, deferDestinations=False) -> list:
+        if deferDestinations:
+            self._destinations = []
+        else:
+            self._destinations = rc.retrieveDestinations()# RETRIEVE Destinations for ListBox
         
         layout = [
             [sg.Text("Full name:"), sg.Input(key='-Name-', do_not_clear=True, size=(20,1))],
@@ -45,6 +63,18 @@ class ReservationsSystem:
             [sg.Button("Reserve Ticket"), sg.Button('See Reservations'), sg.Exit()]
         ]
         return(layout)
+    
+    
+    def _getStatusLayout(self) -> list:
+        layout = [sg.Text('', key='-BUSY-', size=(20,1))]
+        return(layout)
+    
+    
+    # Busy indicator: count database calls submitted (+1) and completed (-1)
+    def _setBusy(self, change: int) -> None:
+        self._pending += change
+        self._window['-BUSY-'].update(value='Working...' if self._pending > 0 else '')
+        return()
 
         
     # Get radio button value and set gender
@@ -64,12 +94,30 @@ class ReservationsSystem:
         
         return(msg)
     
-    # Add reservations to reservations.db
+    # Add reservations to reservations.db, the outcome arrives as a rc.DB_RESULT_EVENT
     def _saveReservation(self, values: dict) -> None:
         tdest = values['-Destination-'][0][0]
+        msg = self._formatReservationInfo(values)
         # CREATE reservation
-        rc.createReservation(values['-Name-'], self._gender,  values['-Passport_Number-'], tdest, values['-Departure-'], \
-            values['-Arrival-'])
+        rc.createReservationAsync(values['-Name-'], self._gender,  values['-Passport_Number-'], tdest, values['-Departure-'], \
+            values['-Arrival-'], self._window, tag=('create', msg))
+        self._setBusy(1)
+        
+        
+    def _handleDBResult(self, tag, result, error) -> None:
+        self._setBusy(-1)
+        if error != None:
+            vb.popup("Error", error, keep_on_top=True)
+            return()
+        if tag == 'destinations':
+            self._destinations = result
+            self._window['-Destination-'].update(values=self._destinations)
+            rs.mark('destinations')
+            rs.report()
+            return()
+        vb.popup("Ticket Reserved", tag[1], keep_on_top=True)
+        self._clearEntries()
+        return()
         
         
     def _clearEntries(self) -> None:
@@ -83,85 +131,35 @@ class ReservationsSystem:
         self._window['-Name-'].set_focus(force=True)
     
     
-    def _is_arrival_before_departure(self, values: dict) -> bool:
-        departure_obj = datetime.strptime(values['-Departure-'], "%Y-%m-%d %H:%M:%S")
-        arrival_obj = datetime.strptime(values['-Arrival-'], "%Y-%m-%d %H:%M:%S")
-        
-        if arrival_obj > departure_obj:
-            return (False)
-        
-        return(True)
-    
-    
-    def _is_departure_before_now(self, values: dict) -> bool:
-        departure_obj = datetime.strptime(values['-Departure-'], "%Y-%m-%d %H:%M:%S")
-        now_obj = datetime.now()
-        
-        if departure_obj > now_obj:
-            return(False)
-        
-        return(True)
-    
-    
-    def _is_arrival_before_now(self, values: dict) -> bool:
-        arrival_obj = datetime.strptime(values['-Arrival-'], "%Y-%m-%d %H:%M:%S")
-        now_obj = datetime.now()
-        
-        if arrival_obj > now_obj:
-            return(False)
+    # Form values as a record dict for reservationsValidation
+    def _getRecord(self, values: dict) -> dict:
+        gender = ''
+        if values['-Male-']:
+            gender = 'Male'
+        elif values['-Female-']:
+            gender = 'Female'
         
-        return(True)
+        destination = ''
+        if len(values['-Destination-']) > 0: # ListBox selection
+            destination = values['-Destination-'][0][0]
+            
+        record = {
+            'name': values['-Name-'],
+            'passport_number': values['-Passport_Number-'],
+            'gender': gender,
+            'departure_dt': values['-Departure-'],
+            'arrival_dt': values['-Arrival-'],
+            'destination': destination,
+        }
+        return(record)
     
     
     def _validate(self, values: dict) -> tuple[bool, str]:
-        is_valid = True
-        values_invalid = []
-        values_missing = []
+        row, errors = rv.validateReservation(self._getRecord(values))
         
-        if len(values['-Name-']) == 0:
-            values_missing.append('Name')
-            is_valid = False
-            
-        if len(values['-Passport_Number-']) == 0:
-            values_missing.append('Passport Number')
-            is_valid = False
-            
-        if not values['-Male-'] and not values['-Female-']:
-            values_missing.append("Gender")
-            is_valid = False
-            
-        if len(values['-Departure-']) == 0:
-            values_missing.append('Departure Date')
-            is_valid = False 
-            
-            
-        if len(values['-Departure-']) > 0:
-            if self._is_departure_before_now(values):
-                values_invalid.append('Departure Date comes before today\'s date!!!\n')
-                is_valid = False 
-                
-                
-        if len(values['-Arrival-']) == 0:
-            values_missing.append('Arrival Date')
-            is_valid = False 
-            
-            
-        if len(values['-Arrival-']) > 0:
-            if self._is_arrival_before_now(values):
-                values_invalid.append('Arrival Date comes before today\'s date!!!\n')
-                is_valid = False 
-                   
-            
-        if len(values['-Departure-']) > 0 and len(values['-Arrival-']) > 0:
-            if self._is_arrival_before_departure(values):
-                values_invalid.append('Arrival Date comes before Departure Date!')
-                is_valid = False 
-            
-        try:  # ListBox validation
-            values['-Destination-'][0][0]
-        except IndexError:
-            values_missing.append('Destination')
-            is_valid = False
+        values_missing = [rv.FIELD_LABELS[e['field']] for e in errors if e['code'] == 'missing']
+        values_invalid = [e['message'] + _MESSAGE_ENDINGS.get(e['code'], "!\n") for e in errors if e['code'] != 'missing']
+        is_valid = len(errors) == 0
             
         missingMsg = "Missing data for the following fields: " + "\n" + ",\n".join(values_missing)
         invalidMsg = "".join(values_invalid)
@@ -184,16 +182,14 @@ class ReservationsSystem:
                 
                 is_valid, error_msg = self._validate(values)
                 if (not is_valid):
-                    sg.popup("Error", error_msg, keep_on_top=True)
+                    vb.popup("Error", error_msg, keep_on_top=True)
                     continue
                 
                 # Save reservation to db
                 self._saveReservation(values)
-                
-                msg = self._formatReservationInfo(values)    
-                sg.popup("Ticket Reserved", msg, keep_on_top=True)
-                
-                self._clearEntries()
+                continue
+            elif event == rc.DB_RESULT_EVENT:
+                self._handleDBResult(*values[event])
                 continue
             elif event == 'See Reservations':
                 # Instantiate and display modal Reservations Window
@@ -213,19 +209,31 @@ class ReservationsWindow:
         self._title = title
         
         self.treedata = sg.TreeData() # Used by reservationsController
+        self.pager = rc.ReservationsPager(pageSize=20) # Used by reservationsController
+        self._pending = 0 # Database calls waiting for a result event
+        self._searchText = '' # Passenger search shown in the tree instead of the pager's page
+        self._searchSeq = 0 # Only the result of the latest typeahead search is shown
         
+        _filterLayout = self._getFilterLayout()
         _treeLayout = self._getTreeLayout()
-        _buttonLayout= [sg.Button('Delete Reservation', disabled=True), sg.Button('Edit Reservation', disabled=True), sg.Exit()]
+        _pageLayout = self._getPageLayout()
+        _buttonLayout= [sg.Button('Delete Reservation', disabled=True), sg.Button('Edit Reservation', disabled=True), \
+            sg.Button('Bulk Edit', disabled=True), sg.Exit()]
         
-        _layout = [_treeLayout, _buttonLayout]
+        _statusLayout = [sg.Text('', key='-BUSY-', size=(20,1))]
         
-        self._window = sg.Window(self._title, _layout, modal=True, keep_on_top=True, finalize=True)
+        _layout = [_filterLayout, _treeLayout, _pageLayout, _buttonLayout, _statusLayout]
+        
+        self._window = vb.window(self._title, _layout, modal=True, keep_on_top=True, finalize=True)
+        self._bindSortHeadings()
+        self._loadPage(self.pager.firstPage) # RETRIEVE first page of reservations from database
+        rc.subscribeChanges(self._window) # Changes made by any process arrive as rc.CHANGES_EVENT
 
 
     def _getTreeLayout(self) -> list:
         
-        self.treedata = rc.retrieveReservations() # RETRIEVE reservations from database
         columns = rc.retrieveTreeColumnNames() # RETRIEVE table column verbose names from database
+        self._sortColumns = rc.retrieveSortColumns() # Heading -> sort column, for the sortable headings
 
         # Tree Frame Layout
         treeLayout = [
@@ -234,8 +242,8 @@ class ReservationsWindow:
                 headings=columns,
                 auto_size_columns=True,
                 justification = 'left',
-                select_mode=sg.TABLE_SELECT_MODE_BROWSE,  # Single row selection
-                num_rows=20,
+                select_mode=sg.TABLE_SELECT_MODE_EXTENDED,  # Shift/Ctrl-click to select several rows
+                num_rows=self.pager.pageSize,
                 col0_width=5,
                 key='-TREE-',
                 show_expanded=False,
@@ -245,15 +253,201 @@ class ReservationsWindow:
                     )]
         ]
         return(treeLayout)
+    
+    
+    # sg.Tree has no heading events, so the sortable headings get a tkinter command that posts a '-SORT-' event
+    def _bindSortHeadings(self) -> None:
+        treeview = self._window['-TREE-'].Widget
+        for heading in self._sortColumns:
+            treeview.heading(heading, command=lambda heading=heading: self._window.write_event_value('-SORT-', heading))
+        return()
+    
+    
+    # Marks the heading of the current sort column with the sort direction (none for ranked search results)
+    def _updateSortHeadings(self) -> None:
+        treeview = self._window['-TREE-'].Widget
+        column, descending = self.pager.sort
+        for heading, name in self._sortColumns.items():
+            text = heading if name != column or len(self._searchText) > 0 else heading + (' \u25bc' if descending else ' \u25b2')
+            treeview.heading(heading, text=text)
+        return()
+    
+    
+    # Clicking the current sort column reverses the direction, another column sorts ascending
+    def _sortBy(self, heading: str) -> None:
+        column = self._sortColumns[heading]
+        current, descending = self.pager.sort
+        descending = not descending if column == current else False
+        self._loadPage(self.pager.setSort, column, descending) # Sorting and paging are done by Sqlite
+        return()
+    
+    
+    def _getFilterLayout(self) -> list:
+        destinations = [''] + [str(e[0]) for e in rc.retrieveDestinations()] # RETRIEVE Destinations for Combo
+        
+        layout = [
+            [sg.Text("Passport #:"), sg.Input(key='-F_Passport-', size=(10,1)), sg.Text("Name starts with:"), sg.Input(key='-F_Name-', size=(15,1)), \
+                sg.Text("Destination:"), sg.Combo(destinations, key='-F_Destination-', size=(15,1), readonly=True)],
+            [sg.Input(key='-F_From-', size=(20,1)), sg.CalendarButton("Departing from", close_when_date_chosen=True, target='-F_From-', no_titlebar=False), \
+                sg.Input(key='-F_To-', size=(20,1)), sg.CalendarButton("Arriving by", close_when_date_chosen=True, target='-F_To-', no_titlebar=False), \
+                sg.Button('Search'), sg.Button('Clear Filters')],
+            [sg.Text("Passenger search:"), sg.Input(key='-F_Text-', size=(30,1), enable_events=True), \
+                sg.Text("(part of a name or passport number)")]
+        ]
+        return(layout)
+    
+    
+    def _getFilters(self, values: dict) -> dict:
+        filters = {
+            'passportNumber': values['-F_Passport-'],
+            'namePrefix': values['-F_Name-'],
+            'destination': values['-F_Destination-'],
+            'dateFrom': values['-F_From-'],
+            'dateTo': values['-F_To-'],
+        }
+        return(filters)
+    
+    
+    def _clearFilters(self) -> None:
+        for key in ('-F_Passport-', '-F_Name-', '-F_Destination-', '-F_From-', '-F_To-'):
+            self._window[key].update(value='')
+        return()
+    
+    
+    def _getPageLayout(self) -> list:
+        layout = [sg.Button('<< Previous'), sg.Text('', key='-PAGE_INFO-', size=(16,1), justification='center'), sg.Button('Next >>'), \
+            sg.Text('Go to page:'), sg.Input(key='-PAGE-', size=(6,1)), sg.Button('Go')]
+        return(layout)
         
     
     # Used by reservationsController to update View
-    def refreshTree(self) -> None:
-        self._window['-TREE-'].update(values=self.treedata)
+    # delta: optional single row change from reservationsController, applied without reloading the tree
+    def refreshTree(self, delta=None) -> None:
+        if delta == None:
+            self._window['-TREE-'].update(values=self.treedata)
+        else:
+            self._applyTreeDelta(delta)
+            if len(self.treedata.root_node.children) == 0: # Page emptied by deletes
+                self._loadPage(self.pager.reload)
+        self._updatePageInfo()
         # print("executed refreshTree()")
         return()
+    
+    
+    def _applyTreeDelta(self, delta: tuple) -> None:
+        tree = self._window['-TREE-']
+        action, key = delta[0], delta[1]
+        if key not in tree.KeyToID: # Row is not on the current page
+            return()
+        node = self.treedata.tree_dict[key]
+        
+        if action == rc.DELTA_UPDATE:
+            node.values = delta[2]
+            tree.Widget.item(tree.KeyToID[key], values=delta[2])
+        elif action == rc.DELTA_DELETE:
+            tree.Widget.delete(tree.KeyToID[key])
+            del tree.IdToKey[tree.KeyToID[key]]
+            del tree.KeyToID[key]
+            del self.treedata.tree_dict[key]
+            self.treedata.root_node.children.remove(node)
+        return()
+    
+    
+    def _updatePageInfo(self) -> None:
+        if len(self._searchText) > 0:
+            count = len(self.treedata.root_node.children)
+            self._window['-PAGE_INFO-'].update(value="{}{} matches".format(count, '+' if count >= rc.SEARCH_LIMIT else ''))
+            return()
+        self._window['-PAGE_INFO-'].update(value="Page {} of {}".format(self.pager.pageNum, self.pager.pageCount()))
+        return()
+    
+    
+    # Typeahead passenger search, run on every keystroke through the DB worker with the current filters.
+    # Results arrive as a rc.DB_RESULT_EVENT tagged ('search', sequence number); stale results are dropped.
+    def _search(self, text: str) -> None:
+        self._searchText = text.strip()
+        self._searchSeq += 1
+        if len(self._searchText) == 0:
+            self._loadPage(self.pager.reload) # Back to the pager's page
+            return()
+        rc.submitDBTask(self._window, ('search', self._searchSeq), rc.searchPassengers, self._searchText, self.pager.filters)
+        self._setBusy(1)
+        return()
+    
+    
+    # Paging and sorting apply to the pager's pages, so they end the passenger search
+    def _endSearch(self) -> None:
+        if len(self._searchText) > 0:
+            self._searchText = ''
+            self._searchSeq += 1
+            self._window['-F_Text-'].update(value='')
+        return()
+    
+    
+    def _showPage(self, treedata: sg.TreeData) -> None:
+        self.treedata = treedata
+        self.refreshTree()
+        self._updateSortHeadings()
+        self._disableDeleteButton(True)
+        self._disableEditButton(True)
+        self._disableBulkEditButton(True)
+        return()
+    
+    
+    # Runs a pager method through the controller's DB worker; the page arrives as a rc.DB_RESULT_EVENT
+    def _loadPage(self, pageFunc, *args) -> None:
+        rc.submitDBTask(self._window, 'page', self._pageTask, pageFunc, *args)
+        self._setBusy(1)
+        return()
+    
+    
+    def _pageTask(self, pageFunc, *args) -> sg.TreeData:
+        treedata = pageFunc(*args)
+        self.pager.pageCount() # Count rows off the GUI thread
+        return(treedata)
+    
+    
+    def _setBusy(self, change: int) -> None:
+        self._pending += change
+        self._window['-BUSY-'].update(value='Working...' if self._pending > 0 else '')
+        return()
+    
+    
+    def _handleDBResult(self, tag, result, error) -> None:
+        self._setBusy(-1)
+        if error != None:
+            vb.popup("Error", error, keep_on_top=True)
+        elif tag == 'page':
+            if len(self._searchText) > 0: # Filters changed or rows were reloaded during a search, search again
+                self._search(self._searchText)
+            else:
+                self._showPage(result)
+        elif isinstance(tag, tuple) and tag[0] == 'search':
+            if tag[1] == self._searchSeq:
+                self._showPage(result)
+        elif tag == 'delete':
+            rc.refreshView(self, result)
+        elif tag in ('bulk_delete', 'bulk_edit'):
+            self._loadPage(self.pager.reload) # One refresh for the whole set
+        return()
+    
+    
+    # Reservations changed in the database (by this or another process): reload the page once, and only if the
+    # changes can affect it. New reservations may belong on the page and change the page count.
+    def _handleChanges(self, changes: dict) -> None:
+        onPage = [idval for idval in changes['updated'] | changes['deleted'] if rc.reservationKey(idval) in self.treedata.tree_dict]
+        if changes['reload'] or len(changes['inserted']) > 0 or len(onPage) > 0:
+            self._loadPage(self.pager.reload) # A passenger search is run again when the page arrives
+        return()
         
     
+    # Values of the selected rows as the tree shows them now, so rows patched or removed since they were selected
+    # are acted on as they are now (current version, no rows that are gone)
+    def _selectedRows(self, values: dict) -> list:
+        tree_dict = self._window.Element('-TREE-').TreeData.tree_dict
+        return([tree_dict[key].values for key in values['-TREE-'] if key in tree_dict])
+    
+    
     def _disableDeleteButton(self, val: bool) -> None:
         self._window['Delete Reservation'].update(disabled=val)
         return()
@@ -262,6 +456,11 @@ class ReservationsWindow:
     def _disableEditButton(self, val: bool) -> None:
         self._window['Edit Reservation'].update(disabled=val)
         return()
+    
+    
+    def _disableBulkEditButton(self, val: bool) -> None:
+        self._window['Bulk Edit'].update(disabled=val)
+        return()
         
         
     def run(self) -> None:
@@ -271,31 +470,157 @@ class ReservationsWindow:
 
             if event in ('Exit', sg.WIN_CLOSED):
                 break 
-            elif event in ('-TREE-'):  # Tree row selected
-                try: 
-                    selected_row_key = values['-TREE-'][0] # This is key for the selected row
-                    rowdata = self._window.Element('-TREE-').TreeData.tree_dict[selected_row_key].values
-                    self._disableDeleteButton(False)
-                    self._disableEditButton(False)
+            elif event == rc.DB_RESULT_EVENT:
+                self._handleDBResult(*values[event])
+                continue
+            elif event == rc.CHANGES_EVENT:
+                self._handleChanges(values[event])
+                continue
+            elif event == '-F_Text-':
+                self._search(values['-F_Text-'])
+                continue
+            elif event == '-SORT-':
+                self._endSearch()
+                self._sortBy(values['-SORT-'])
+                continue
+            elif event == 'Next >>':
+                self._endSearch()
+                self._loadPage(self.pager.nextPage)
+                continue
+            elif event == '<< Previous':
+                self._endSearch()
+                self._loadPage(self.pager.previousPage)
+                continue
+            elif event == 'Search':
+                self._loadPage(self.pager.setFilters, self._getFilters(values))
+                continue
+            elif event == 'Clear Filters':
+                self._clearFilters()
+                self._loadPage(self.pager.setFilters, None)
+                continue
+            elif event == 'Go':
+                try:
+                    pageNum = int(values['-PAGE-'])
+                except ValueError:
+                    vb.popup("Error", "Page number must be a whole number", keep_on_top=True)
                     continue
-                except IndexError: # Ignore this exception (occurs when the tree is refreshed)
+                self._endSearch()
+                self._loadPage(self.pager.jumpToPage, pageNum)
+                continue
+            elif event in ('-TREE-'):  # Tree row(s) selected
+                selected = self._selectedRows(values)
+                if len(selected) == 0: # Selection cleared (occurs when the tree is refreshed)
+                    self._disableDeleteButton(True)
+                    self._disableEditButton(True)
+                    self._disableBulkEditButton(True)
+                    continue
+                self._disableDeleteButton(False)
+                self._disableEditButton(len(selected) != 1)
+                self._disableBulkEditButton(False)
+                continue
+            elif event == 'Bulk Edit':
+                selected = self._selectedRows(values)
+                if len(selected) == 0:
                     continue
+                bulkWin = ReservationsBulkEditWindow(len(selected), 'DarkAmber')
+                changes = bulkWin.run()
+                if changes != None:
+                    rc.reassignReservationsAsync([row[0] for row in selected], self._window, **changes)
+                    self._setBusy(1)
+                continue
             elif event in ('Delete Reservation'):
-                # DELETE selected reservation using reservation_id; refrence to self enables controller to refreshTree()
-                rc.deleteReservation(rowdata[0], self) 
+                selected = self._selectedRows(values)
+                if len(selected) == 0:
+                    continue
+                if len(selected) == 1:
+                    # DELETE selected reservation using reservation_id and the version shown; the tree delta arrives as a rc.DB_RESULT_EVENT
+                    rc.deleteReservationAsync(selected[0][0], self._window, version=selected[0][7])
+                else:
+                    if vb.popupYesNo("Delete {} reservations?".format(len(selected)), keep_on_top=True) != 'Yes':
+                        continue
+                    # DELETE all selected reservations in one transaction, the page is reloaded afterwards
+                    rc.deleteReservationsAsync([row[0] for row in selected], self._window)
+                self._setBusy(1)
                 self._disableDeleteButton(True)
                 self._disableEditButton(True)
+                self._disableBulkEditButton(True)
                 continue
             # Display Edit Reservation Window: pass reference to self
             elif event in ('Edit Reservation'):
-                editWin = ReservationsEditWindow(self, rowdata, 'DarkAmber') 
+                selected = self._selectedRows(values)
+                if len(selected) != 1:
+                    continue
+                editWin = ReservationsEditWindow(self, selected[0], 'DarkAmber') 
                 editWin.run()
                 continue
                 
+        rc.unsubscribeChanges(self._window)
         self._window.close()
 
 
         
+# Modal Window for changing the destination and/or dates of several reservations at once.
+# run() returns the changes as keyword arguments for rc.reassignReservations(), or None if cancelled.
+class ReservationsBulkEditWindow:
+    def __init__(self, count, theme='lightGreen') -> None:
+        self._themeStr = theme
+        sg.theme(self._themeStr)
+        
+        destinations = rc.retrieveDestinations() # RETRIEVE Destinations for ListBox
+        
+        layout = [
+            [sg.Text("Change {} selected reservations. Leave a field empty to keep it.".format(count))],
+            [sg.Input(key='-Departure-', size=(20,1)), sg.CalendarButton("Date of Departure", close_when_date_chosen=True, target='-Departure-', no_titlebar=False)],
+            [sg.Input(key='-Arrival-', size=(20,1)), sg.CalendarButton("Date of Arrival", close_when_date_chosen=True, target='-Arrival-', no_titlebar=False)],
+            [sg.Text("Select A Destination:")],
+            [sg.Listbox(values=destinations, key='-Destination-', size=(40,5), select_mode="single")],
+            [sg.Button('Apply'), sg.Button('Cancel')]
+        ]
+        self._window = vb.window('Bulk Edit Reservations', layout, modal=True, keep_on_top=True, finalize=True)
+        
+        
+    def _getChanges(self, values: dict) -> tuple[dict, str]:
+        changes = {}
+        departure = values['-Departure-'].strip()
+        arrival = values['-Arrival-'].strip()
+        
+        if len(values['-Destination-']) > 0:
+            changes['destination'] = values['-Destination-'][0][0]
+        if len(departure) > 0 or len(arrival) > 0:
+            # Dates are changed together so the arrival can be checked against the departure
+            if len(departure) == 0 or len(arrival) == 0:
+                return(None, "Enter both the Departure and the Arrival Date")
+            errors = rv.validateDates(departure, arrival)
+            if len(errors) > 0:
+                return(None, "\n".join(e['message'] for e in errors))
+            changes['departure_dt'] = departure
+            changes['arrival_dt'] = arrival
+            
+        if len(changes) == 0:
+            return(None, "Nothing to change")
+        return(changes, "")
+        
+        
+    def run(self) -> dict:
+        changes = None
+        # Process events
+        while True:
+            event, values = self._window.Read()
+            
+            if event in (sg.WIN_CLOSED, 'Cancel'):
+                break
+            elif event == 'Apply':
+                changes, error_msg = self._getChanges(values)
+                if changes == None:
+                    vb.popup("Error", error_msg, keep_on_top=True)
+                    continue
+                break
+            
+        self._window.close()
+        return(changes)
+
+
+
 # Modal Window for editing reservations, note use of inheritance     
 class ReservationsEditWindow(ReservationsSystem):  
     def __init__(self, resWin, rowdata, theme='lightGreen'):
@@ -303,12 +628,13 @@ class ReservationsEditWindow(ReservationsSystem):
         self._rowdata = rowdata
         self._themeStr = theme
         self._gender = ""
+        self._pending = 0
         
         # Set GUI theme           
         sg.theme(self._themeStr)
 
-        self._layout = [self._getIdLayout(), super()._getFormLayout(), self._getButtonLayout()]
-        self._window = sg.Window('Edit Reservation', self._layout, modal=True, keep_on_top=True, finalize=True)
+        self._layout = [self._getIdLayout(), super()._getFormLayout(), self._getButtonLayout(), self._getStatusLayout()]
+        self._window = vb.window('Edit Reservation', self._layout, modal=True, keep_on_top=True, finalize=True)
         
         self.populateEntries(self._rowdata, self._window)
         
@@ -325,14 +651,13 @@ class ReservationsEditWindow(ReservationsSystem):
             window['-Male-'].update(value=False)
             window['-Female-'].update(value=True)
             
-        destList = [str(e[0]) for e in self._destinations] # Get list of destinations strings
-        index = destList.index(rowdata[4])
-        window['-Destination-'].update(set_to_index=[index])
+        index = rc.retrieveDestinationIndex(rowdata[4])
+        window['-Destination-'].update(set_to_index=[] if index == None else [index])
         
-        date_time = rowdata[5].strftime("%Y-%m-%d %H:%M:%S") 
+        date_time = rc.formatDateTime(rowdata[5])
         window['-Departure-'].update(value=date_time)
         
-        date_time = rowdata[6].strftime("%Y-%m-%d %H:%M:%S")
+        date_time = rc.formatDateTime(rowdata[6])
         window['-Arrival-'].update(value=date_time)
         
         window['-Name-'].set_focus(force=True)
@@ -351,18 +676,25 @@ class ReservationsEditWindow(ReservationsSystem):
         return(layout)
     
     
-    def _saveReservation(self, values: dict) -> tuple[bool,str]:
+    # Update reservation, the outcome arrives as a rc.DB_RESULT_EVENT
+    def _saveReservation(self, values: dict) -> None:
         tdest = values['-Destination-'][0][0]
-        # Update reservation
-        try:
-            # Pass refrence to resWin to enable controller to execute resWin.refreshTree()
-            rc.updateReservation(values['-Id-'], values['-Name-'], self._gender,  values['-Passport_Number-'], \
-                tdest, values['-Departure-'], values['-Arrival-'], self._resWin)
-            retval = (True, "Update successful")
-            return(retval)
-        except Exception as e:
-            retval = (False, e)
-            return(retval)
+        # Row version read with the reservation: the update fails with a conflict if someone else changed it
+        rc.updateReservationAsync(values['-Id-'], values['-Name-'], self._gender,  values['-Passport_Number-'], \
+            tdest, values['-Departure-'], values['-Arrival-'], self._window, version=self._rowdata[7])
+        self._setBusy(1)
+        
+        
+    def _handleDBResult(self, tag, result, error) -> None:
+        self._setBusy(-1)
+        if error != None:
+            vb.popup("Error", error, keep_on_top=True)
+            return()
+        # Pass refrence to resWin to enable controller to execute resWin.refreshTree()
+        rc.refreshView(self._resWin, result)
+        self._rowdata = result[2] # Saved row, with its new version
+        vb.popup("Success", "Edit Saved", keep_on_top=True)
+        return()
     
     
     def run(self) -> None:
@@ -377,17 +709,14 @@ class ReservationsEditWindow(ReservationsSystem):
 
                 is_valid, error_msg = super()._validate(values)
                 if (not is_valid):
-                    sg.popup("Error", error_msg, keep_on_top=True)
+                    vb.popup("Error", error_msg, keep_on_top=True)
                     continue
                 
                 # Update reservation
-                is_valid, error_msg = self._saveReservation(values)
-                if (not is_valid):
-                    sg.popup("Error", error_msg, keep_on_top=True)
-                    continue
-                else:
-                    sg.popup("Success", "Edit Saved", keep_on_top=True)
-                
+                self._saveReservation(values)
+                continue
+            elif event == rc.DB_RESULT_EVENT:
+                self._handleDBResult(*values[event])
                 continue
         
         self._window.close()
@@ -396,8 +725,22 @@ class ReservationsEditWindow(ReservationsSystem):
     
 def main():
     
-    App = ReservationsSystem('DarkAmber')
-    App.run()
+    # Opt-in timings: RESERVATIONS_INSTRUMENT=1
+    if os.environ.get('RESERVATIONS_INSTRUMENT', '') not in ('', '0'):
+        import reservationsInstrumentation as ri # Only loaded when asked for
+        ri.enableFromEnvironment()
+        ri.instrument(ReservationsWindow, ['refreshTree', '_showPage'], 'ReservationsWindow')
+    
+    rc.startDBWorker() # Database calls run off the GUI thread
+    if os.environ.get('RESERVATIONS_READ_SNAPSHOT', '') not in ('', '0'):
+        rc.enableReadSnapshot() # Serve the reads from an in-memory copy of the database
+    rc.startChangeNotifier() # Keeps open Reservations windows current with other clerks' changes
+    try:
+        App = ReservationsSystem('DarkAmber')
+        App.run()
+    finally:
+        rc.stopChangeNotifier()
+        rc.stopDBWorker()
 
 
 if __name__ == '__main__':
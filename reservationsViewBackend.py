@@ -0,0 +1,348 @@
+# Window backends for reservationsView.
+# The View creates its windows and popups through window(), popup() and popupYesNo() below, which hand them to the
+# current backend:
+#   PySimpleGUIBackend  real PySimpleGUI windows (default)
+#   HeadlessBackend     windows without a display: widget updates are recorded and events are replayed from scripts
+#                       through the View's own run() loops, so the GUI layer can be tested and profiled on a CI box
+#
+# Headless use:
+#   backend = HeadlessBackend()
+#   backend.script('Reservations', ['Next >>', ('-F_Text-', {'-F_Text-': 'smi'}), 'Exit'])
+#   setBackend(backend)
+#   ReservationsWindow('Reservations').run()
+#   backend.windows[-1].updates, backend.windows[-1].timings, backend.popups
+#
+# Each window takes the next script queued for its title; a window without a script (or at the end of it) reads
+# WIN_CLOSED. A script event is an event key, or (event key, values) where values is a dict of element values to set
+# before the event (what the user typed or selected) or a function of the window returning that dict.
+# Events posted with write_event_value() (rc.DB_RESULT_EVENT, rc.CHANGES_EVENT) are read before the next scripted
+# event. Without a running DB worker the controller runs database calls inline, so their result events are always
+# queued in time and a replay is deterministic.
+
+import queue
+import threading
+import time
+from collections import deque
+import PySimpleGUI as sg
+
+
+# PySimpleGUI ---------------------------------------------------------------------------------------------------------------------
+class PySimpleGUIBackend:
+    headless = False
+
+    def window(self, title, layout, **options):
+        return(sg.Window(title, layout, **options))
+
+
+    def popup(self, *args, **options):
+        return(sg.popup(*args, **options))
+
+
+    def popupYesNo(self, *args, **options):
+        return(sg.popup_yes_no(*args, **options))
+# End of PySimpleGUI --------------------------------------------------------------------------------------------------------------
+
+
+# Headless -----------------------------------------------------------------------------------------------------------------------
+# Value carried in the values dict by each kind of input element, as PySimpleGUI reports it
+def _initialValue(element):
+    if isinstance(element, sg.Tree):
+        return([]) # Selected row keys
+    if isinstance(element, sg.Listbox):
+        return(list(element.DefaultValues or []))
+    if isinstance(element, sg.Combo):
+        return('' if element.DefaultValue == None else element.DefaultValue)
+    if isinstance(element, (sg.Radio, sg.Checkbox)):
+        return(bool(element.InitialState))
+    if isinstance(element, (sg.Input, sg.Multiline)):
+        return(element.DefaultText)
+    return(None)
+
+
+_VALUE_ELEMENTS = (sg.Tree, sg.Listbox, sg.Combo, sg.Radio, sg.Checkbox, sg.Input, sg.Multiline)
+
+
+# Keyed elements of a layout: nested lists of rows and container elements (Column, Frame, Tab)
+def _layoutElements(layout):
+    for item in layout:
+        if isinstance(item, (list, tuple)):
+            yield from _layoutElements(item)
+        elif isinstance(item, sg.Element):
+            if item.Key != None:
+                yield item
+            if hasattr(item, 'Rows'):
+                yield from _layoutElements(item.Rows)
+
+
+# Stands in for an element's widget state: its value, choices and disabled flag
+class HeadlessElement:
+    def __init__(self, window, element) -> None:
+        self._window = window
+        self.element = element
+        self.Key = element.Key
+        self.value = _initialValue(element)
+        self.values = list(getattr(element, 'Values', None) or [])
+        self.disabled = bool(getattr(element, 'Disabled', False))
+
+
+    def update(self, **options) -> None:
+        self._window._record(self.Key, 'update', options)
+        if 'values' in options:
+            self.values = list(options['values'])
+            self.value = [] if isinstance(self.element, sg.Listbox) else ''
+        if 'value' in options:
+            self._setValue(options['value'])
+        if 'set_to_index' in options:
+            indexes = options['set_to_index']
+            indexes = [indexes] if isinstance(indexes, int) else indexes
+            self.value = [self.values[n] for n in indexes]
+        if 'disabled' in options and options['disabled'] != None:
+            self.disabled = options['disabled']
+        return()
+
+
+    # Selecting a radio button clears the others in its group
+    def _setValue(self, value) -> None:
+        self.value = value
+        if isinstance(self.element, sg.Radio) and value:
+            for other in self._window.elements.values():
+                if other is not self and isinstance(other.element, sg.Radio) and other.element.GroupID == self.element.GroupID:
+                    other.value = False
+        return()
+
+
+    def set_focus(self, force=False) -> None:
+        self._window._record(self.Key, 'set_focus', {'force': force})
+        return()
+
+
+# The parts of ttk.Treeview that reservationsView uses, recorded on the window
+class HeadlessTreeview:
+    def __init__(self, window, key) -> None:
+        self._window = window
+        self._key = key
+        self.headings = {} # Heading -> options (text, command)
+
+
+    def heading(self, column, **options) -> None:
+        self.headings.setdefault(column, {}).update(options)
+        self._window._record(self._key, 'heading', dict(options, column=column))
+        return()
+
+
+    def item(self, iid, **options) -> None:
+        self._window._record(self._key, 'item', dict(options, iid=iid))
+        return()
+
+
+    def delete(self, iid) -> None:
+        self._window._record(self._key, 'delete', {'iid': iid})
+        return()
+
+
+# sg.Tree: update(values=TreeData) replaces the rows and numbers them like the real widget's KeyToID/IdToKey maps
+class HeadlessTree(HeadlessElement):
+    def __init__(self, window, element) -> None:
+        super().__init__(window, element)
+        self.Widget = HeadlessTreeview(window, element.Key)
+        self._setTreeData(element.TreeData)
+
+
+    def _setTreeData(self, treedata) -> None:
+        self.TreeData = treedata
+        self.KeyToID = {'': ''}
+        self.IdToKey = {'': ''}
+        if treedata == None:
+            return()
+        for n, key in enumerate(k for k in treedata.tree_dict if k != ''):
+            self.KeyToID[key] = str(n + 1)
+            self.IdToKey[str(n + 1)] = key
+        return()
+
+
+    def update(self, **options) -> None:
+        if 'values' not in options:
+            super().update(**options)
+            return()
+        self._window._record(self.Key, 'update', options)
+        self._setTreeData(options['values'])
+        self.value = [] # Replacing the rows clears the selection
+        return()
+
+
+# Window without a display. updates: (key, method, options) for every widget change, in order;
+# timings: (event, event value, ms) for every event read, ms being the time the run() loop spent handling it.
+class HeadlessWindow:
+    def __init__(self, backend, title, layout, script, options) -> None:
+        self.backend = backend
+        self.title = title
+        self.options = options
+        self.closed = False
+        self.updates = []
+        self.timings = []
+        self._script = deque(script)
+        self._posted = queue.Queue() # (event, value) from write_event_value(), any thread
+        self._lastEvent = None
+        self._lastRead = None
+        self.elements = {}
+        for element in _layoutElements(layout):
+            if isinstance(element, sg.Tree):
+                self.elements[element.Key] = HeadlessTree(self, element)
+            else:
+                self.elements[element.Key] = HeadlessElement(self, element)
+
+
+    def _record(self, key, method, options) -> None:
+        if self.backend.record:
+            self.updates.append((key, method, options))
+        return()
+
+
+    def __getitem__(self, key):
+        return(self.elements[key])
+
+
+    def Element(self, key):
+        return(self.elements[key])
+
+
+    def write_event_value(self, key, value) -> None:
+        self._posted.put((key, value))
+        return()
+
+
+    def _values(self) -> dict:
+        return({key: e.value for key, e in self.elements.items() if isinstance(e.element, _VALUE_ELEMENTS)})
+
+
+    def _nextEvent(self) -> tuple:
+        try:
+            event, value = self._posted.get_nowait()
+            return(event, value, {})
+        except queue.Empty:
+            pass
+        if len(self._script) > 0:
+            item = self._script.popleft()
+            event, changes = item if isinstance(item, tuple) else (item, {})
+            return(event, None, changes(self) if callable(changes) else changes)
+        try: # End of the script: results of calls still running on the DB worker
+            event, value = self._posted.get(timeout=self.backend.idleTimeout) if self.backend.idleTimeout > 0 else self._posted.get_nowait()
+            return(event, value, {})
+        except queue.Empty:
+            return(sg.WIN_CLOSED, None, {})
+
+
+    def read(self, timeout=None, timeout_key=sg.TIMEOUT_KEY, close=False) -> tuple:
+        start = time.perf_counter()
+        if self._lastRead != None:
+            self.timings.append((self._lastEvent[0], self._lastEvent[1], (start - self._lastRead) * 1000))
+        if self.closed:
+            return((sg.WIN_CLOSED, None))
+        event, value, changes = self._nextEvent()
+        if event == sg.WIN_CLOSED:
+            self._lastRead = None
+            return((sg.WIN_CLOSED, None))
+        for key, v in changes.items():
+            if key in self.elements:
+                self.elements[key]._setValue(v)
+        values = self._values()
+        if value != None:
+            values[event] = value
+        elif event in changes and event not in values: # e.g. the heading of a '-SORT-' event
+            values[event] = changes[event]
+        self._lastEvent = (event, values.get(event))
+        self._lastRead = time.perf_counter()
+        if close:
+            self.close()
+        return((event, values))
+
+
+    Read = read
+
+
+    def close(self) -> None:
+        self.closed = True
+        return()
+
+
+# record: keep the widget updates (turn off for long benchmark replays); idleTimeout: seconds a window waits at the
+# end of its script for result events of calls still running on the DB worker; yesNo: answer of popupYesNo()
+class HeadlessBackend:
+    headless = True
+
+    def __init__(self, record=True, idleTimeout=0.0, yesNo='Yes') -> None:
+        self.record = record
+        self.idleTimeout = idleTimeout
+        self.yesNo = yesNo
+        self.windows = [] # Every window created, in order
+        self.popups = [] # (args, options) of every popup shown
+        self._scripts = {} # Title -> deque of scripts
+        self._lock = threading.Lock()
+
+
+    # Queues events for the next window titled title
+    def script(self, title, events) -> None:
+        with self._lock:
+            self._scripts.setdefault(title, deque()).append(list(events))
+        return()
+
+
+    def window(self, title, layout, **options):
+        with self._lock:
+            scripts = self._scripts.get(title)
+            events = scripts.popleft() if scripts else []
+        window = HeadlessWindow(self, title, layout, events, options)
+        self.windows.append(window)
+        return(window)
+
+
+    def popup(self, *args, **options):
+        self.popups.append((args, options))
+        return('OK')
+
+
+    def popupYesNo(self, *args, **options):
+        self.popups.append((args, options))
+        return(self.yesNo)
+
+
+    # Event timings of all windows: event label -> list of ms; result events are labelled with their tag
+    def eventTimings(self) -> dict:
+        timings = {}
+        for window in self.windows:
+            for event, value, ms in window.timings:
+                label = str(event)
+                if isinstance(value, tuple) and len(value) == 3: # rc.DB_RESULT_EVENT: (tag, result, error)
+                    tag = value[0]
+                    label = "{} {}".format(event, tag[0] if isinstance(tag, tuple) else tag)
+                timings.setdefault(label, []).append(ms)
+        return(timings)
+# End of headless ----------------------------------------------------------------------------------------------------------------
+
+
+_backend = None
+
+
+def getBackend():
+    global _backend
+    if _backend == None:
+        _backend = PySimpleGUIBackend()
+    return(_backend)
+
+
+def setBackend(backend) -> None:
+    global _backend
+    _backend = backend
+    return()
+
+
+def window(title, layout, **options):
+    return(getBackend().window(title, layout, **options))
+
+
+def popup(*args, **options):
+    return(getBackend().popup(*args, **options))
+
+
+def popupYesNo(*args, **options):
+    return(getBackend().popupYesNo(*args, **options))
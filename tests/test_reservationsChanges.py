@@ -0,0 +1,83 @@
+# The change notifier: polls the change log and posts CHANGES_EVENT to subscribed windows.
+
+import queue
+import time
+import pytest
+import reservationsController as rc
+import reservationsModel as rm
+
+
+@pytest.fixture
+def database(tmp_path):
+    rm.configureDatabase(str(tmp_path / 'reservations.db'))
+    rm.create_tables()
+    rm.db.connect()
+    rm.addDestinationsRecords()
+    yield
+    rm.db.close()
+
+
+# Stands in for a window: collects the posted events
+class _Window:
+    def __init__(self) -> None:
+        self.events = queue.Queue()
+
+
+    def write_event_value(self, key, value) -> None:
+        self.events.put((key, value))
+        return()
+
+
+def _add(n) -> None:
+    rm.createReservation('Passenger {:02d}'.format(n), 'Female', 'P{:07d}'.format(n), 'Tokyo', '2099-01-01 10:00:00', \
+        '2099-02-01 10:00:00')
+    return()
+
+
+def test_notifier_survives_a_locked_database_at_startup(database, monkeypatch):
+    calls = []
+    hasChanges = rm.hasReservationsChanges
+    def lockedOnce():
+        calls.append(1)
+        if len(calls) == 1:
+            raise rm.OperationalError('database is locked')
+        return(hasChanges())
+    monkeypatch.setattr(rm, 'hasReservationsChanges', lockedOnce)
+    window = _Window()
+    notifier = rc.ChangeNotifier(interval=0.01, maxDelay=0.0)
+    notifier.subscribe(window)
+    try:
+        deadline = time.monotonic() + 5
+        while notifier._dataVersion == None and time.monotonic() < deadline: # Wait for the retried sync
+            time.sleep(0.01)
+        assert notifier._dataVersion != None
+        _add(1)
+        key, changes = window.events.get(timeout=5)
+    finally:
+        notifier.stop()
+    assert key == rc.CHANGES_EVENT
+    assert len(changes['inserted']) == 1
+
+
+def test_own_edits_are_not_reported(database):
+    _add(1)
+    _add(2)
+    window = _Window()
+    rc.startChangeNotifier(interval=0.01, maxDelay=0.0)
+    rc.subscribeChanges(window)
+    try:
+        deadline = time.monotonic() + 5
+        while not rc._changeNotifier.usesChangeLog() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        rc.updateReservation(1, 'Passenger 01', 'Male', 'P0000001', 'Havana', '2099-01-01 10:00:00', '2099-02-01 10:00:00', \
+            version=1)
+        rc.deleteReservation(2, version=1)
+        time.sleep(0.1) # Several polls
+        rm.updateReservationsBatch([1], {'name': 'Passenger One'}) # Not patched into any window
+        key, changes = window.events.get(timeout=5)
+    finally:
+        rc.stopChangeNotifier()
+    assert key == rc.CHANGES_EVENT
+    assert changes['updated'] == {1}
+    assert changes['deleted'] == set()
+    assert window.events.empty()
@@ -0,0 +1,55 @@
+# The in-memory read snapshot: reads from several threads share one copy, and commits from any thread refresh it.
+
+import threading
+import pytest
+import reservationsModel as rm
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    rm.configureDatabase(str(tmp_path / 'reservations.db'))
+    rm.create_tables()
+    rm.db.connect()
+    rm.addDestinationsRecords()
+    _add(0)
+    rm.enableReadSnapshot()
+    yield
+    rm.disableReadSnapshot()
+    rm.db.close()
+
+
+def _add(n) -> None:
+    rm.createReservation('Passenger {:02d}'.format(n), 'Female', 'P{:07d}'.format(n), 'Tokyo', '2099-01-01 10:00:00', \
+        '2099-02-01 10:00:00')
+    return()
+
+
+def _inThread(function, *args) -> None:
+    thread = threading.Thread(target=function, args=args)
+    thread.start()
+    thread.join()
+    return()
+
+
+def _refreshes() -> int:
+    return(rm.getReadSnapshotStats()['refreshes'])
+
+
+def test_reads_from_another_thread_reuse_the_snapshot(snapshot):
+    before = _refreshes()
+    assert rm.getReservationsCount() == 1
+    _inThread(rm.getReservationsCount)
+    assert rm.getReservationsCount() == 1
+    assert _refreshes() - before == 1
+
+
+def test_commits_from_any_thread_refresh_the_snapshot(snapshot):
+    before = _refreshes()
+    assert rm.getReservationsCount() == 1
+    _add(1)
+    counts = []
+    _inThread(lambda: counts.append(rm.getReservationsCount()))
+    assert counts == [2]
+    _inThread(_add, 2)
+    assert rm.getReservationsCount() == 3
+    assert _refreshes() - before == 3
@@ -0,0 +1,75 @@
+# validateBatch() must report the same errors as validateReservation() record by record, with and without NumPy.
+
+from datetime import datetime
+import pytest
+import reservationsValidation as rv
+
+
+NOW = datetime(2030, 6, 1, 12, 0, 0)
+DESTINATIONS = ['Tokyo', 'Havana']
+
+RECORDS = [
+    {'name': 'Ann Lee', 'passport_number': 'A1234567', 'gender': 'Female', 'departure_dt': '2031-01-01 10:00:00', 'arrival_dt': '2031-01-02 10:00:00', 'destination': 'Tokyo'},
+    {'name': '', 'passport_number': None, 'gender': '', 'departure_dt': '', 'arrival_dt': '', 'destination': ''},
+    {'name': ' Bo ', 'passport_number': 'B1', 'gender': 'Other', 'departure_dt': '2031-13-01 10:00:00', 'arrival_dt': 'tomorrow', 'destination': 'Paris'},
+    {'name': 'Cy', 'passport_number': 'C1', 'gender': 'Male', 'departure_dt': '2030-05-01 10:00:00', 'arrival_dt': '2030-06-01 12:00:00', 'destination': 'Havana'},
+    {'name': 'Di', 'passport_number': 'D1', 'gender': 'Male', 'departure_dt': '2031-01-02 10:00:00', 'arrival_dt': '2031-01-01 10:00:00', 'destination': 'Tokyo'},
+    {'name': 'Ed', 'passport_number': 'E1', 'gender': 'Female', 'departure_dt': '2031-01-01', 'arrival_dt': ' 2031-01-03 10:00:00 ', 'destination': ' Havana '},
+    {'name': 'Fa', 'passport_number': 'F1', 'gender': 'Male', 'departure_dt': '2031-02-30 10:00:00', 'arrival_dt': '2031-01-01 10:00:00', 'destination': 'Tokyo'},
+    # Parsed by NumPy or strptime but not DATE_FORMAT's exact text
+    {'name': 'Gu', 'passport_number': 'G1', 'gender': 'Male', 'departure_dt': '2099-01-01 10:00-00', 'arrival_dt': '+099-01-01 10:00:00', 'destination': 'Tokyo'},
+    {'name': 'Ha', 'passport_number': 'H1', 'gender': 'Female', 'departure_dt': '0000-01-01 10:00:00', 'arrival_dt': '2099-01-01 10:0:00', 'destination': 'Havana'},
+    {'name': 'Io', 'passport_number': 'I1', 'gender': 'Female', 'departure_dt': '2099-1-01 10:00:00', 'arrival_dt': '2099-01-01T10:00:00', 'destination': 'Havana'},
+]
+
+
+def _columns(records: list) -> dict:
+    return({field: [record.get(field) for record in records] for field in rv.FIELD_NAMES})
+
+
+def _perRecord() -> tuple:
+    results = [rv.validateReservation(record, NOW, DESTINATIONS) for record in RECORDS]
+    rows = {field: [row[field] for row, errors in results] for field in rv.FIELD_NAMES}
+    return(rows, [errors for row, errors in results])
+
+
+# Errors are compared as sets: the batch checks the fields in the same order, but this test is about the findings
+def _errorSets(errors: list) -> list:
+    return([sorted((e['field'], e['code'], e['message']) for e in recordErrors) for recordErrors in errors])
+
+
+@pytest.fixture
+def pythonOnly(monkeypatch):
+    monkeypatch.setattr(rv, 'np', None)
+    monkeypatch.setattr(rv, '_numpyChecked', True)
+
+
+def test_numpy_batch_matches_per_record():
+    if rv._loadNumpy() == None:
+        pytest.skip("NumPy is not installed")
+    rows, errors = rv.validateBatch(_columns(RECORDS), NOW, DESTINATIONS)
+    expectedRows, expectedErrors = _perRecord()
+    assert rows == expectedRows
+    assert _errorSets(errors) == _errorSets(expectedErrors)
+
+
+def test_python_batch_matches_per_record(pythonOnly):
+    rows, errors = rv.validateBatch(_columns(RECORDS), NOW, DESTINATIONS)
+    expectedRows, expectedErrors = _perRecord()
+    assert rows == expectedRows
+    assert _errorSets(errors) == _errorSets(expectedErrors)
+
+
+def test_numpy_and_python_batches_agree(monkeypatch):
+    if rv._loadNumpy() == None:
+        pytest.skip("NumPy is not installed")
+    numpyResult = rv.validateBatch(_columns(RECORDS), NOW, DESTINATIONS)
+    monkeypatch.setattr(rv, 'np', None)
+    pythonResult = rv.validateBatch(_columns(RECORDS), NOW, DESTINATIONS)
+    assert numpyResult == pythonResult
+
+
+def test_dates_must_match_the_format_exactly():
+    for text in ['2099-01-01 10:00-00', '+099-01-01 10:00:00', '0000-01-01 10:00:00', '2099-01-01 10:0:00', '2099-1-1 10:00:00']:
+        assert rv.parseDateTime(text) == None
+    assert rv.parseDateTime('2099-01-01 10:00:00') == datetime(2099, 1, 1, 10, 0, 0)
@@ -0,0 +1,92 @@
+# Scripted replays of the Reservations window on the headless view backend (no display needed).
+# The DB worker is not started, so database calls run inline and every replay is deterministic.
+
+import time
+import pytest
+import reservationsController as rc
+import reservationsModel as rm
+import reservationsView as view
+import reservationsViewBackend as vb
+
+
+@pytest.fixture
+def backend(tmp_path):
+    rm.configureDatabase(str(tmp_path / 'reservations.db'))
+    rm.create_tables()
+    rm.db.connect()
+    rm.addDestinationsRecords()
+    for n in range(30):
+        rm.createReservation('Passenger {:02d}'.format(n), 'Female', 'P{:07d}'.format(n), ['Tokyo', 'Havana', 'London'][n % 3], \
+            '2099-01-{:02d} 10:00:00'.format(n % 28 + 1), '2099-02-01 10:00:00')
+    rm.db.close()
+    rc.invalidateDestinations()
+    rc.clearQueryCache()
+    headless = vb.HeadlessBackend()
+    vb.setBackend(headless)
+    yield headless
+    vb.setBackend(None)
+    rm.db.close()
+
+
+def _firstRow(window) -> dict:
+    return({'-TREE-': [key for key in window['-TREE-'].TreeData.tree_dict if key != ''][:1]})
+
+
+def _reservationIds() -> list:
+    return([row[0] for row in rm.getReservationsRows()])
+
+
+def test_paging_updates_page_info(backend):
+    backend.script('Reservations', ['Next >>', 'Exit'])
+    view.ReservationsWindow('Reservations').run()
+    window = backend.windows[-1]
+    assert window.closed
+    assert window['-PAGE_INFO-'].value == 'Page 2 of 2'
+    assert len(window['-TREE-'].TreeData.tree_dict) == 11 # 10 rows and the root
+
+
+def test_sort_by_destination_heading(backend):
+    backend.script('Reservations', [('-SORT-', {'-SORT-': 'Destination'}), 'Exit'])
+    view.ReservationsWindow('Reservations').run()
+    tree = backend.windows[-1]['-TREE-']
+    cities = [node.values[4] for node in tree.TreeData.root_node.children]
+    assert cities == sorted(cities)
+    assert tree.Widget.headings['Destination']['text'] == 'Destination ▲'
+
+
+# An edit patches the row in the tree with its new version; deleting it afterwards must use that version
+def test_edit_then_delete(backend):
+    backend.script('Reservations', [('-TREE-', _firstRow), 'Edit Reservation', 'Delete Reservation', 'Exit'])
+    backend.script('Edit Reservation', [('Save Reservation', {'-Name-': 'Edited Name'}), 'Exit'])
+    newest = _reservationIds()[0]
+    view.ReservationsWindow('Reservations').run()
+    assert [args[0] for args, options in backend.popups] == ['Success']
+    assert newest not in _reservationIds()
+    assert len(_reservationIds()) == 29
+
+
+def test_delete_conflict_is_reported(backend):
+    backend.script('Reservations', [('-TREE-', _firstRow), 'Delete Reservation', 'Exit'])
+    window = view.ReservationsWindow('Reservations')
+    newest = _reservationIds()[0]
+    rm.updateReservation(newest, 'Changed Elsewhere', 'Male', 'X0000000', 'Tokyo', '2099-03-01 10:00:00', '2099-03-02 10:00:00')
+    window.run()
+    assert [args[0] for args, options in backend.popups] == ['Error']
+    assert newest in _reservationIds()
+
+
+def test_own_edit_does_not_reload_the_page(backend):
+    rc.startChangeNotifier(interval=0.01, maxDelay=0.0)
+    try:
+        deadline = time.monotonic() + 5
+        while not rc._changeNotifier.usesChangeLog() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        backend.idleTimeout = 0.5 # Wait for change events after the script
+        backend.script('Reservations', [('-TREE-', _firstRow), 'Edit Reservation'])
+        backend.script('Edit Reservation', [('Save Reservation', {'-Name-': 'Edited Name'}), 'Exit'])
+        view.ReservationsWindow('Reservations').run()
+    finally:
+        rc.stopChangeNotifier()
+    events = [event for event, value, ms in backend.windows[0].timings]
+    assert rc.CHANGES_EVENT not in events
+    assert events.count(rc.DB_RESULT_EVENT) == 1 # The first page only